@@ -0,0 +1,99 @@
+"""
+管理接口（需配置 SAM3_ADMIN_TOKEN，并在请求头 X-Admin-Token 中携带）
+"""
+import hmac
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse
+
+from ..core.config import ADMIN_TOKEN, MODEL_ROUTE_TIMEOUT, PROFILE_MAX_SECONDS
+from ..core.model_pool import model_pool
+from ..core.profiling import sample_profile, slow_request_recorder
+
+
+def require_admin(x_admin_token: str = Header(default="")):
+    """校验管理令牌；未配置令牌时管理接口整体关闭"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin API disabled: SAM3_ADMIN_TOKEN not set")
+    # 按字节比较：compare_digest 对含非 ASCII 字符的 str 会抛出 TypeError
+    if not hmac.compare_digest(x_admin_token.encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+
+def _check_index(index: int) -> None:
+    if not 0 <= index < len(model_pool.replicas):
+        raise HTTPException(status_code=404, detail=f"Replica not found: {index}")
+
+
+@router.get("/replicas")
+async def list_replicas():
+    """各模型副本状态与负载"""
+    return model_pool.stats()
+
+
+@router.post("/replicas/{index}/drain")
+async def drain_replica(index: int, timeout: float = MODEL_ROUTE_TIMEOUT):
+    """排空副本：停止向其路由新请求并等待进行中请求完成"""
+    _check_index(index)
+    drained = await run_in_threadpool(model_pool.drain, index, timeout)
+    return {"drained": drained, "replica": model_pool.replicas[index].stats()}
+
+
+@router.post("/replicas/{index}/resume")
+async def resume_replica(index: int):
+    """恢复排空中的副本"""
+    _check_index(index)
+    model_pool.resume(index)
+    return model_pool.replicas[index].stats()
+
+
+@router.post("/replicas/{index}/reload")
+async def reload_replica(index: int, timeout: float = MODEL_ROUTE_TIMEOUT):
+    """热加载单个副本（排空 -> 重新加载 -> 恢复），其余副本继续服务"""
+    _check_index(index)
+    try:
+        return await run_in_threadpool(model_pool.reload, index, timeout)
+    except TimeoutError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.post("/replicas/reload")
+async def reload_all_replicas(timeout: float = MODEL_ROUTE_TIMEOUT):
+    """逐个热加载全部副本"""
+    try:
+        return await run_in_threadpool(model_pool.reload_all, timeout)
+    except TimeoutError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+
+@router.post("/profile", response_class=PlainTextResponse)
+async def profile(
+    seconds: float = Query(default=10.0, gt=0, le=PROFILE_MAX_SECONDS),
+    interval_ms: float = Query(default=10.0, ge=1, le=1000),
+):
+    """
+    对运行中的进程做采样分析，返回 folded stacks 文本
+    （可直接交给 flamegraph.pl 或导入 speedscope 查看火焰图）
+    """
+    return await run_in_threadpool(sample_profile, seconds, interval_ms / 1000)
+
+
+@router.get("/slow_requests")
+async def list_slow_requests(include_input: bool = False):
+    """
+    最近采集的慢请求：参数、各阶段耗时、mask 数量、图像尺寸、输入指纹。
+    include_input=true 时附带 base64 原始输入（需开启 SAM3_SLOW_REQUEST_CAPTURE_INPUT），
+    导出结果可交给 tools/replay_slow_requests.py 离线回放。
+    """
+    return slow_request_recorder.records(include_input=include_input)
+
+
+@router.delete("/slow_requests")
+async def clear_slow_requests():
+    """清空慢请求缓冲"""
+    slow_request_recorder.clear()
+    return {"cleared": True}
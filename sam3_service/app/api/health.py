@@ -3,8 +3,17 @@
 """
 from fastapi import APIRouter
 
-from ..core.config import DEVICE, SAM3_HF_REPO, SAM3_MODE
-from ..core.sam3_model import sam3_model
+from ..core.config import (
+    DEVICE,
+    MAX_IMAGE_SIZE,
+    SAM3_HF_REPO,
+    SAM3_MODE,
+    UPLOAD_ACCEPTED_FORMATS,
+    UPLOAD_QUALITY,
+)
+from ..core.buffer_pool import buffer_pool
+from ..core.memory_budget import memory_budget
+from ..core.model_pool import model_pool
 
 router = APIRouter()
 
@@ -13,10 +22,19 @@ router = APIRouter()
 async def health_check():
     """服务健康检查"""
     return {
-        "status": "ok" if sam3_model.is_loaded else "model_not_loaded",
+        "status": "ok" if model_pool.is_loaded else "model_not_loaded",
         "mode": SAM3_MODE,  # "mock" or "real"
         "device": DEVICE,
         "hf_repo": SAM3_HF_REPO,
-        "model_loaded": sam3_model.is_loaded,
+        "model_loaded": model_pool.is_loaded,
         "backend": "fastapi",
+        # 客户端上传参数：本地缩放到工作分辨率并压缩后再上传
+        "max_image_size": MAX_IMAGE_SIZE,
+        "accepted_formats": UPLOAD_ACCEPTED_FORMATS,
+        "upload_quality": UPLOAD_QUALITY,
+        # 各模型副本的负载与利用率
+        "replicas": model_pool.stats(),
+        # 内存：缓冲池复用情况与请求准入预算
+        "buffer_pool": buffer_pool.stats(),
+        "memory_budget": memory_budget.stats(),
     }
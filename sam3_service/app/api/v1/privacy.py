@@ -1,14 +1,27 @@
 """
 隐私过滤接口
 """
-from typing import List, Literal
+import json
+from typing import List, Literal, Optional
 
-from fastapi import APIRouter, File, UploadFile, Form
+from fastapi import APIRouter, File, UploadFile, Form, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 
-from ...core.config import DEFAULT_BLUR_STRENGTH, AUTO_MASK_MIN_AREA_RATIO
-from ...core.image_io import decode_image_from_bytes, encode_image_to_base64, resize_if_needed
+from ...core.buffer_pool import buffer_pool
+from ...core.config import DEFAULT_BLUR_STRENGTH, AUTO_MASK_MIN_AREA_RATIO, AUTO_MASK_MAX_COUNT
+from ...core.image_io import (
+    decode_image_from_bytes,
+    decode_image_resized,
+    encode_image_to_base64,
+    probe_image_size,
+    resize_if_needed,
+)
+from ...core.memory_budget import memory_budget
 from ...core.pipeline_privacy import privacy_pipeline, BlurType
+from ...core.profiling import annotate, trace_request
+from ...core.result_store import result_store
+from ...core.roi import parse_rois
 
 router = APIRouter(prefix="/privacy", tags=["privacy"])
 
@@ -22,6 +35,7 @@ class AppliedRegionInfo(BaseModel):
 class PrivacyFilterResponse(BaseModel):
     filtered_image_base64: str
     applied_regions: List[AppliedRegionInfo]
+    result_id: Optional[str] = None  # 分割结果 id，可用于 /render 重新渲染
 
 
 @router.post("/filter", response_model=PrivacyFilterResponse)
@@ -32,6 +46,8 @@ async def privacy_filter(
     blur_strength: int = Form(default=DEFAULT_BLUR_STRENGTH),
     min_area_ratio: float = Form(default=AUTO_MASK_MIN_AREA_RATIO),
     text_prompt: str = Form(default="all objects"),
+    rois: Optional[str] = Form(default=None),  # JSON string: [{"x1":..., "y1":..., "x2":..., "y2":...}]
+    store: bool = Form(default=True),
 ):
     """
     隐私过滤接口
@@ -39,26 +55,138 @@ async def privacy_filter(
     - mode: 目前只支持 "auto"（自动分割所有区域）
     - blur_type: gaussian / pixelate / solid
     - blur_strength: 模糊强度
-    - min_area_ratio: 最小 mask 面积占比
+    - min_area_ratio: 最小 mask 面积占比（指定 rois 时相对单个 ROI 面积）
+    - rois: 只在这些矩形（原图坐标）内分割与处理，每个 ROI 以更高分辨率单独分割
+    - store: 是否保存分割结果（含未打码原图）供 /render 重新渲染；
+      为 false 或服务端关闭结果存储时不落盘，返回 result_id=None
     """
-    # 读取并预处理图像
+    # 读取图像，先按尺寸预估内存做准入（必要时降低工作分辨率）
     data = await image.read()
-    img_arr = decode_image_from_bytes(data)
-    img_arr, scale = resize_if_needed(img_arr)
+    params = {
+        "mode": mode,
+        "blur_type": blur_type,
+        "blur_strength": blur_strength,
+        "min_area_ratio": min_area_ratio,
+        "text_prompt": text_prompt,
+        "rois": rois,
+        "store": store,
+    }
+    src_h, src_w = probe_image_size(data)
+    try:
+        roi_rects = parse_rois(rois, src_w, src_h)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
     
-    # 调用隐私过滤流水线
-    result = privacy_pipeline.filter_auto(
-        image=img_arr,
+    with trace_request("privacy/filter", data, params), \
+            memory_budget.admit(src_h, src_w, num_masks=AUTO_MASK_MAX_COUNT, rois=roi_rects) as max_size:
+        if roi_rects:
+            # ROI 模式：保留原图用于裁剪 ROI，输出图仍为缩放后的整图
+            source = decode_image_from_bytes(data)
+            img_arr, scale = resize_if_needed(source, max_size)
+            annotate(image_size=list(img_arr.shape[:2]), source_size=[src_h, src_w], roi_count=len(roi_rects))
+            
+            result = await run_in_threadpool(
+                privacy_pipeline.filter_rois,
+                image=img_arr,
+                source=source,
+                rois=roi_rects,
+                scale=scale,
+                blur_type=blur_type,
+                blur_strength=blur_strength,
+                min_area_ratio=min_area_ratio,
+                text_prompt=text_prompt,
+                max_size=max_size,
+            )
+        else:
+            img_arr, scale = decode_image_resized(data, max_size)
+            annotate(image_size=list(img_arr.shape[:2]), source_size=[src_h, src_w])
+            
+            # 调用隐私过滤流水线
+            # 在线程池中执行，使多个模型副本可以并发处理
+            result = await run_in_threadpool(
+                privacy_pipeline.filter_auto,
+                image=img_arr,
+                blur_type=blur_type,
+                blur_strength=blur_strength,
+                min_area_ratio=min_area_ratio,
+                text_prompt=text_prompt,
+            )
+        
+        annotate(mask_count=len(result.masks))
+        
+        # 保存分割结果（后续调整参数时无需重新推理）与编码均为阻塞操作，放到线程池执行
+        return await run_in_threadpool(
+            _store_and_respond, img_arr, result, store and result_store.enabled
+        )
+
+
+@router.post("/render", response_model=PrivacyFilterResponse)
+async def privacy_render(
+    result_id: str = Form(...),
+    blur_type: BlurType = Form(default="gaussian"),
+    blur_strength: int = Form(default=DEFAULT_BLUR_STRENGTH),
+    mask_ids: Optional[str] = Form(default=None),  # JSON string: [0, 2, 5]，为空表示全部
+    min_score: float = Form(default=0.0),
+):
+    """
+    基于已存储的分割结果重新渲染（不重新推理）
+    
+    - result_id: /filter 返回的结果 id
+    - blur_type / blur_strength: 新的模糊参数
+    - mask_ids: 只处理指定的 mask
+    - min_score: 只处理 score 不低于该阈值的 mask
+    """
+    params = {
+        "result_id": result_id,
+        "blur_type": blur_type,
+        "blur_strength": blur_strength,
+        "mask_ids": mask_ids,
+        "min_score": min_score,
+    }
+    selected = None
+    if mask_ids:
+        try:
+            selected = set(int(i) for i in json.loads(mask_ids))
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=422, detail="mask_ids must be a JSON list of integers")
+    
+    with trace_request("privacy/render", None, params):
+        try:
+            stored = await run_in_threadpool(
+                result_store.load, result_id, min_score=min_score, mask_ids=selected
+            )
+        except KeyError:
+            raise HTTPException(status_code=404, detail=f"Result not found or expired: {result_id}")
+        
+        h, w = stored.image.shape[:2]
+        annotate(image_size=[h, w], mask_count=len(stored.masks))
+        with memory_budget.admit(h, w, num_masks=len(stored.masks), max_size=None):
+            return await run_in_threadpool(_render_and_respond, stored, blur_type, blur_strength)
+
+
+def _store_and_respond(img_arr, result, store: bool) -> PrivacyFilterResponse:
+    """按需保存分割结果并编码响应（阻塞，在线程池中调用）"""
+    result_id = result_store.save(img_arr, result.masks) if store else None
+    buffer_pool.release(img_arr)
+    return _build_response(result, result_id)
+
+
+def _render_and_respond(stored, blur_type: str, blur_strength: int) -> PrivacyFilterResponse:
+    """基于已存储结果合成并编码响应（阻塞，在线程池中调用）"""
+    result = privacy_pipeline.composite(
+        image=stored.image,
+        masks=stored.masks,
         blur_type=blur_type,
         blur_strength=blur_strength,
-        min_area_ratio=min_area_ratio,
-        text_prompt=text_prompt,
     )
-    
-    # 编码结果图像
+    return _build_response(result, stored.result_id)
+
+
+def _build_response(result, result_id: Optional[str]) -> PrivacyFilterResponse:
+    """编码结果图像并构造响应，编码后归还结果图缓冲"""
     filtered_b64 = encode_image_to_base64(result.filtered_image)
+    buffer_pool.release(result.filtered_image)
     
-    # 构造响应
     regions = [
         AppliedRegionInfo(
             mask_id=r.mask_id,
@@ -71,4 +199,5 @@ async def privacy_filter(
     return PrivacyFilterResponse(
         filtered_image_base64=filtered_b64,
         applied_regions=regions,
+        result_id=result_id,
     )
@@ -3,15 +3,27 @@
 """
 from typing import List, Optional
 
-from fastapi import APIRouter, File, UploadFile, Form
+from fastapi import APIRouter, File, UploadFile, Form, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 from PIL import Image, ImageDraw
 import numpy as np
 from scipy import ndimage
 
+from ...core.buffer_pool import buffer_pool
 from ...core.config import AUTO_MASK_MIN_AREA_RATIO, AUTO_MASK_MAX_COUNT
-from ...core.image_io import decode_image_from_bytes, encode_image_to_base64, resize_if_needed
-from ...core.sam3_model import sam3_model
+from ...core.image_io import (
+    decode_image_from_bytes,
+    decode_image_resized,
+    encode_image_to_base64,
+    mask_bounds,
+    probe_image_size,
+    resize_if_needed,
+)
+from ...core.memory_budget import expected_mask_count, memory_budget
+from ...core.model_pool import model_pool
+from ...core.profiling import annotate, stage, trace_request
+from ...core.roi import parse_rois, segment_rois
 
 router = APIRouter(prefix="/segment", tags=["segmentation"])
 
@@ -38,58 +50,124 @@ class TextPreviewResponse(BaseModel):
     applied_regions: List[MaskInfo]
 
 
+def _parse_rois_or_422(rois: Optional[str], width: int, height: int) -> list:
+    """解析 ROI 参数，格式错误时返回 422"""
+    try:
+        return parse_rois(rois, width, height)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
 @router.post("/auto", response_model=SegmentAutoResponse)
 async def segment_auto(
     image: UploadFile = File(...),
     max_masks: int = Form(default=AUTO_MASK_MAX_COUNT),
     min_area_ratio: float = Form(default=AUTO_MASK_MIN_AREA_RATIO),
+    rois: Optional[str] = Form(default=None),  # JSON string: [{"x1":..., "y1":..., "x2":..., "y2":...}]
 ):
     """
     自动分割（无 prompt）
+    
+    - rois: 只在这些矩形（原图坐标）内分割，返回的 bbox 仍为原图坐标
     """
-    # 读取图像
+    # 读取图像（该接口不输出图像，只按分割所需预估内存；超出上限时降低工作分辨率，
+    # 返回的 bbox / area 仍换算回原图坐标）。
+    # ROI 模式只在原图上裁剪各 ROI 分割，不生成整幅 mask，内存按 ROI 面积预估
     data = await image.read()
-    img_arr = decode_image_from_bytes(data)
-    h, w = img_arr.shape[:2]
-    
-    # 调用模型
-    results = sam3_model.segment_auto(
-        img_arr,
-        min_area_ratio=min_area_ratio,
-        max_masks=max_masks,
-    )
+    params = {"max_masks": max_masks, "min_area_ratio": min_area_ratio, "rois": rois}
+    src_h, src_w = probe_image_size(data)
+    roi_rects = _parse_rois_or_422(rois, src_w, src_h)
+    with trace_request("segment/auto", data, params), \
+            memory_budget.admit(
+                src_h, src_w, num_masks=expected_mask_count(max_masks), max_size=max(src_h, src_w),
+                render=False, rois=roi_rects, full_frame=not roi_rects,
+            ) as max_size:
+        # 调用模型
+        if roi_rects:
+            source = decode_image_from_bytes(data)
+            h, w = src_h, src_w
+            scale = 1.0
+            results = await run_in_threadpool(
+                segment_rois,
+                source,
+                roi_rects,
+                out_shape=(h, w),
+                min_area_ratio=min_area_ratio,
+                max_masks=max_masks,
+                max_size=max_size,  # 仅在内存不足时限制 ROI 裁剪图的分辨率
+                expand_masks=False,
+            )
+        else:
+            img_arr, scale = decode_image_resized(data, max_size)
+            h, w = img_arr.shape[:2]
+            results = await run_in_threadpool(
+                model_pool.segment_auto,
+                img_arr,
+                min_area_ratio=min_area_ratio,
+                max_masks=max_masks,
+            )
+            buffer_pool.release(img_arr)
+        annotate(
+            image_size=[h, w], source_size=[src_h, src_w],
+            mask_count=len(results), roi_count=len(roi_rects),
+        )
     
-    # 构造响应
+    # 构造响应（工作坐标 -> 原图坐标）
     masks = [
         MaskInfo(
             mask_id=r.mask_id,
-            bbox=list(r.bbox),
-            area=r.area,
+            bbox=_to_source_bbox(r.bbox, scale, src_w, src_h),
+            area=int(round(r.area / (scale * scale))),
             score=r.score,
         )
         for r in results
     ]
     
-    return SegmentAutoResponse(masks=masks, image_size=[h, w])
+    return SegmentAutoResponse(masks=masks, image_size=[src_h, src_w])
+
+
+def _to_source_bbox(bbox, scale: float, src_w: int, src_h: int) -> List[int]:
+    """将工作分辨率下的 bbox 换算回原图坐标"""
+    if scale == 1.0:
+        return list(bbox)
+    x1, y1, x2, y2 = bbox
+    return [
+        int(x1 / scale), int(y1 / scale),
+        min(src_w, int(round(x2 / scale))), min(src_h, int(round(y2 / scale))),
+    ]
 
 
 def apply_outline_preview(img_arr: np.ndarray, masks: list, outline_width: int = 3) -> np.ndarray:
-    """轮廓描边预览"""
-    preview_arr = img_arr.copy()
+    """
+    轮廓描边预览
+    
+    结果从 buffer_pool 借出，用完后应归还；腐蚀只在 mask 外接矩形内计算
+    （外扩 1 像素的背景即可保证与整帧计算结果一致）。
+    """
+    preview_arr = buffer_pool.acquire(img_arr.shape, np.uint8)
+    np.copyto(preview_arr, img_arr)
     outline_color = np.array([255, 255, 0], dtype=np.uint8)  # 黄色高亮
     
     for r in masks:
-        mask = r.mask.astype(bool)
+        bounds = mask_bounds(r.mask, pad=1)
+        if bounds is None:
+            continue
+        mask = r.mask[bounds].astype(bool)
         eroded = ndimage.binary_erosion(mask, iterations=outline_width)
         outline = mask ^ eroded
-        preview_arr[outline] = outline_color
+        preview_arr[bounds][outline] = outline_color
     
     return preview_arr
 
 
 def apply_heatmap_preview(img_arr: np.ndarray, masks: list, alpha: float = 0.6) -> np.ndarray:
-    """热力图预览：基于距离场的冷暖色渐变"""
-    preview_arr = img_arr.copy().astype(np.float32)
+    """
+    热力图预览：基于距离场的冷暖色渐变
+    
+    结果从 buffer_pool 借出，用完后应归还；距离场与颜色插值只在 mask 外接矩形 / mask 像素上计算。
+    """
+    preview_arr = buffer_pool.acquire(img_arr.shape, np.float32)
+    np.copyto(preview_arr, img_arr)
     
     # 冷暖色谱：蓝 -> 青 -> 绿 -> 黄 -> 橙
     # 使用 matplotlib 风格的 colormap
@@ -102,12 +180,13 @@ def apply_heatmap_preview(img_arr: np.ndarray, masks: list, alpha: float = 0.6)
     ], dtype=np.float32)
     
     for r in masks:
-        mask = r.mask.astype(bool)
-        if not mask.any():
+        bounds = mask_bounds(r.mask, pad=1)
+        if bounds is None:
             continue
+        mask = r.mask[bounds].astype(bool)
         
-        # 计算距离场：每个像素到边缘的距离
-        dist = ndimage.distance_transform_edt(mask)
+        # 计算距离场：每个像素到边缘的距离（只取 mask 内像素）
+        dist = ndimage.distance_transform_edt(mask)[mask]
         
         # 归一化到 [0, 1]
         max_dist = dist.max()
@@ -124,23 +203,21 @@ def apply_heatmap_preview(img_arr: np.ndarray, masks: list, alpha: float = 0.6)
         upper = np.clip(upper, 0, n_colors - 1)
         frac = indices - lower
         
-        # 插值颜色
-        heat_color = np.zeros((*mask.shape, 3), dtype=np.float32)
-        for i in range(3):
-            heat_color[..., i] = (
-                colormap[lower, i] * (1 - frac) + 
-                colormap[upper, i] * frac
-            )
+        # 插值颜色，(N, 3)
+        heat_color = (
+            colormap[lower] * (1 - frac)[:, None] +
+            colormap[upper] * frac[:, None]
+        ).astype(np.float32)
         
         # 只在 mask 区域叠加热力图（alpha 混合）
-        for i in range(3):
-            preview_arr[..., i] = np.where(
-                mask,
-                preview_arr[..., i] * (1 - alpha) + heat_color[..., i] * alpha,
-                preview_arr[..., i]
-            )
+        region = preview_arr[bounds]
+        region[mask] = region[mask] * (1 - alpha) + heat_color * alpha
     
-    return np.clip(preview_arr, 0, 255).astype(np.uint8)
+    np.clip(preview_arr, 0, 255, out=preview_arr)
+    out = buffer_pool.acquire(img_arr.shape, np.uint8)
+    np.copyto(out, preview_arr, casting="unsafe")
+    buffer_pool.release(preview_arr)
+    return out
 
 
 @router.post("/text_preview", response_model=TextPreviewResponse)
@@ -150,31 +227,69 @@ async def text_preview(
     preview_mode: str = Form(default="heatmap"),  # "outline" 或 "heatmap"
     max_masks: int = Form(default=AUTO_MASK_MAX_COUNT),
     min_area_ratio: float = Form(default=AUTO_MASK_MIN_AREA_RATIO),
+    rois: Optional[str] = Form(default=None),  # JSON string: [{"x1":..., "y1":..., "x2":..., "y2":...}]
 ):
     """
     基于文本提示词的分割预览
     
     - preview_mode: "outline"（轮廓描边）或 "heatmap"（热力图渐变）
+    - rois: 只在这些矩形（原图坐标）内分割，每个 ROI 以更高分辨率单独分割
     """
     data = await image.read()
-    img_arr = decode_image_from_bytes(data)
-    img_arr, scale = resize_if_needed(img_arr)
-    h, w = img_arr.shape[:2]
-
-    results = sam3_model.segment_auto(
-        img_arr,
-        min_area_ratio=min_area_ratio,
-        max_masks=max_masks,
-        text_prompt=text_prompt,
-    )
+    params = {
+        "text_prompt": text_prompt,
+        "preview_mode": preview_mode,
+        "max_masks": max_masks,
+        "min_area_ratio": min_area_ratio,
+        "rois": rois,
+    }
+    src_h, src_w = probe_image_size(data)
+    roi_rects = _parse_rois_or_422(rois, src_w, src_h)
+    with trace_request("segment/text_preview", data, params), \
+            memory_budget.admit(
+                src_h, src_w, num_masks=expected_mask_count(max_masks), preview=True, rois=roi_rects,
+            ) as max_size:
+        if roi_rects:
+            # ROI 模式：保留原图用于裁剪 ROI，预览图仍为缩放后的整图
+            source = decode_image_from_bytes(data)
+            img_arr, scale = resize_if_needed(source, max_size)
+            h, w = img_arr.shape[:2]
+            results = await run_in_threadpool(
+                segment_rois,
+                source,
+                roi_rects,
+                out_shape=(h, w),
+                scale=scale,
+                min_area_ratio=min_area_ratio,
+                max_masks=max_masks,
+                text_prompt=text_prompt,
+                max_size=max_size,
+            )
+        else:
+            img_arr, scale = decode_image_resized(data, max_size)
+            h, w = img_arr.shape[:2]
+            results = await run_in_threadpool(
+                model_pool.segment_auto,
+                img_arr,
+                min_area_ratio=min_area_ratio,
+                max_masks=max_masks,
+                text_prompt=text_prompt,
+            )
+        annotate(
+            image_size=[h, w], source_size=[src_h, src_w],
+            mask_count=len(results), roi_count=len(roi_rects),
+        )
 
-    # 根据模式生成预览
-    if preview_mode == "heatmap":
-        preview_arr = apply_heatmap_preview(img_arr, results)
-    else:
-        preview_arr = apply_outline_preview(img_arr, results)
+        # 根据模式生成预览
+        with stage("preview"):
+            if preview_mode == "heatmap":
+                preview_arr = apply_heatmap_preview(img_arr, results)
+            else:
+                preview_arr = apply_outline_preview(img_arr, results)
+        buffer_pool.release(img_arr)
 
-    preview_b64 = encode_image_to_base64(preview_arr)
+        preview_b64 = encode_image_to_base64(preview_arr)
+        buffer_pool.release(preview_arr)
 
     regions = [
         MaskInfo(
@@ -201,7 +316,7 @@ async def segment_prompt(
     """
     基于 prompt 的分割（点/框）
     
-    TODO: 解析 points/boxes JSON，调用 sam3_model.segment_with_prompts
+    TODO: 解析 points/boxes JSON，调用 model_pool.segment_with_prompts
     """
     # 读取图像
     data = await image.read()
@@ -0,0 +1,113 @@
+"""
+图像尺寸数组的复用缓冲池
+解码、合成、预览、编码各阶段从池中借用 uint8 / bool / float 数组，用完归还，
+避免并发下反复申请释放整帧内存导致 RSS 抖动和分配器碎片
+"""
+import threading
+import weakref
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from .config import BUFFER_POOL_MAX_BYTES
+
+
+def _size_class(nbytes: int) -> int:
+    """
+    将请求大小向上取整到尺寸档位：每个 2 的幂区间再均分 8 档，浪费不超过 12.5%。
+    不同宽高比的图像只要字节数相近即可复用同一块缓冲。
+    """
+    if nbytes <= 4096:
+        return 4096
+    step = 1 << max(nbytes.bit_length() - 4, 0)
+    return (nbytes + step - 1) // step * step
+
+
+class BufferPool:
+    """
+    按尺寸档位缓存一维 uint8 缓冲，借出时 view 成所需的 shape / dtype。
+
+    - acquire：借出数组（内容未初始化）
+    - release：归还数组；只接受本池借出的数组，其他数组会被忽略
+    - 空闲缓冲总量超过 max_bytes 时不再缓存，直接交给 GC
+    - 借出后未归还的缓冲随数组被 GC 一并回收，不会泄漏
+    """
+
+    def __init__(self, max_bytes: int = BUFFER_POOL_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._free: Dict[int, List[np.ndarray]] = {}
+        self._leased: "weakref.WeakValueDictionary[int, np.ndarray]" = weakref.WeakValueDictionary()
+        self._free_bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def acquire(self, shape: Tuple[int, ...], dtype=np.uint8) -> np.ndarray:
+        """借出指定 shape / dtype 的数组（内容未初始化）"""
+        dtype = np.dtype(dtype)
+        nbytes = int(np.prod(shape)) * dtype.itemsize
+        size = _size_class(nbytes)
+
+        buf = None
+        with self._lock:
+            free = self._free.get(size)
+            if free:
+                buf = free.pop()
+                self._free_bytes -= size
+                self.hits += 1
+            else:
+                self.misses += 1
+        if buf is None:
+            buf = np.empty(size, dtype=np.uint8)
+
+        with self._lock:
+            self._leased[id(buf)] = buf
+        return buf[:nbytes].view(dtype).reshape(shape)
+
+    def release(self, arr: np.ndarray) -> None:
+        """归还借出的数组；归还后调用方不得再使用该数组"""
+        if not isinstance(arr, np.ndarray):
+            return
+        root = arr
+        while isinstance(root.base, np.ndarray):
+            root = root.base
+
+        with self._lock:
+            if self._leased.get(id(root)) is not root:
+                return  # 非本池借出，或已归还
+            del self._leased[id(root)]
+            size = root.nbytes
+            if self._free_bytes + size > self.max_bytes:
+                return
+            self._free.setdefault(size, []).append(root)
+            self._free_bytes += size
+
+    @contextmanager
+    def borrow(self, shape: Tuple[int, ...], dtype=np.uint8):
+        """借出数组，退出上下文时自动归还"""
+        arr = self.acquire(shape, dtype)
+        try:
+            yield arr
+        finally:
+            self.release(arr)
+
+    def clear(self) -> None:
+        """丢弃所有空闲缓冲"""
+        with self._lock:
+            self._free.clear()
+            self._free_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "free_bytes": self._free_bytes,
+                "max_bytes": self.max_bytes,
+                "leased": len(self._leased),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+# 全局实例
+buffer_pool = BufferPool()
@@ -3,6 +3,7 @@ SAM3 服务配置
 """
 import os
 from pathlib import Path
+from typing import List, Optional
 
 # === 运行模式 ===
 # 通过环境变量控制：SAM3_MODE=mock（默认）或 SAM3_MODE=real
@@ -32,10 +33,90 @@ def get_device() -> str:
 
 DEVICE = get_device()
 
+
+def get_devices() -> List[str]:
+    """
+    模型副本所在设备列表，每个设备（或 CPU 分片）一个副本。
+    通过环境变量 SAM3_DEVICES 指定，如 "cuda:0,cuda:1" 或 "cpu,cpu,cpu"；
+    未指定时 real 模式使用全部可见 GPU，否则使用 DEVICE 单副本。
+    多个 CPU 副本在同一进程内并发推理，其线程数见 get_cpu_threads。
+    """
+    env = os.getenv("SAM3_DEVICES", "")
+    devices = [d.strip() for d in env.split(",") if d.strip()]
+    if devices:
+        return devices
+    if SAM3_MODE == "real" and DEVICE.startswith("cuda"):
+        import torch
+        return [f"cuda:{i}" for i in range(torch.cuda.device_count())]
+    return [DEVICE]
+
+DEVICES = get_devices()
+
+
+def get_cpu_threads() -> Optional[int]:
+    """
+    real 模式下 torch 的 intra-op 线程数（进程级设置，对所有副本生效）。
+    通过环境变量 SAM3_CPU_THREADS 指定；未指定且有多个 CPU 副本时按副本数均分 CPU 核数，
+    避免每个副本都占满全部核心导致超额订阅；否则返回 None（保持 torch 默认）。
+    """
+    env = os.getenv("SAM3_CPU_THREADS", "")
+    if env:
+        return max(1, int(env))
+    cpu_replicas = sum(1 for d in DEVICES if d.startswith("cpu"))
+    if cpu_replicas <= 1:
+        return None
+    return max(1, (os.cpu_count() or 1) // cpu_replicas)
+
+CPU_THREADS = get_cpu_threads()
+
+# === 模型池配置 ===
+MODEL_AFFINITY_CACHE_SIZE = 1024  # 记录最近多少张图片被路由到哪个副本
+MODEL_AFFINITY_SLACK = 1  # 亲和副本的排队数最多比最空闲副本多几个时，仍优先使用亲和副本
+MODEL_ROUTE_TIMEOUT = 60.0  # 所有副本都不可用（如单副本热加载中）时最长等待秒数
+EMBEDDING_CACHE_SIZE = 4  # 每个副本缓存最近几张图片的图像编码（real 模式）
+MODEL_UTILIZATION_WINDOW = 60.0  # 副本利用率统计的滑动窗口（秒）
+
+# === 管理接口配置 ===
+# 未设置 SAM3_ADMIN_TOKEN 时管理接口不可用；请求需携带 X-Admin-Token 头
+ADMIN_TOKEN = os.getenv("SAM3_ADMIN_TOKEN", "")
+
+# === 性能诊断配置 ===
+SLOW_REQUEST_THRESHOLD_MS = float(os.getenv("SAM3_SLOW_REQUEST_MS", "2000"))  # 超过该耗时的请求会被采集
+SLOW_REQUEST_BUFFER_SIZE = int(os.getenv("SAM3_SLOW_REQUEST_BUFFER", "50"))  # 慢请求环形缓冲大小
+# 是否保存慢请求的原始输入（用于离线回放）；关闭时只保存输入的 sha256
+SLOW_REQUEST_CAPTURE_INPUT = os.getenv("SAM3_SLOW_REQUEST_CAPTURE_INPUT", "0").lower() in ("1", "true", "yes")
+PROFILE_MAX_SECONDS = 60  # 采样分析单次最长时长
+
 # === 图像处理配置 ===
 MAX_IMAGE_SIZE = 2048  # 长边最大尺寸，超过会缩放
+# 前端上传时优先使用的格式（按优先级排列），通过 /health 下发给客户端，
+# 客户端先在本地缩放到 MAX_IMAGE_SIZE 再压缩上传，避免上传服务端会丢弃的像素
+UPLOAD_ACCEPTED_FORMATS = ["image/webp", "image/jpeg", "image/png"]
+UPLOAD_QUALITY = 0.92  # 客户端有损压缩质量（0~1）
+
+# === 内存配置 ===
+# 图像尺寸数组复用池，空闲缓冲总量上限
+BUFFER_POOL_MAX_BYTES = int(os.getenv("SAM3_BUFFER_POOL_MAX_MB", "512")) * 1024 * 1024
+# 进程内所有进行中请求的预估内存总量上限，超出时返回 503
+MEMORY_BUDGET_BYTES = int(os.getenv("SAM3_MEMORY_BUDGET_MB", "4096")) * 1024 * 1024
+# 单个请求的预估内存上限，超出时降低工作分辨率，仍超出则返回 413
+REQUEST_MEMORY_LIMIT_BYTES = int(os.getenv("SAM3_REQUEST_MEMORY_LIMIT_MB", "1024")) * 1024 * 1024
+MIN_IMAGE_SIZE = 512  # 内存不足降级时的最小长边
+# 预估内存时按调用方 max_masks 与该值中较小者计算 mask 数量：
+# max_masks 只是上限，实际返回数量通常远小于它，避免过大的上限导致无谓的降级 / 413
+MEMORY_ESTIMATE_MAX_MASKS = int(os.getenv("SAM3_MEMORY_ESTIMATE_MAX_MASKS", "50"))
 DEFAULT_BLUR_STRENGTH = 21  # 默认模糊强度
 
 # === 分割配置 ===
 AUTO_MASK_MIN_AREA_RATIO = 0.01  # 自动分割时，mask 最小面积占比（过滤噪点）
 AUTO_MASK_MAX_COUNT = 50  # 自动分割最多返回的 mask 数量
+MAX_ROI_COUNT = 16  # 单次请求最多指定的 ROI 数量（每个 ROI 单独推理一次）
+
+# === 结果存储配置 ===
+# 分割结果（原图 + 压缩 mask + 分数）落盘到本地目录，以 memmap 方式读取，
+# 便于重启后复用以及多 worker 共享，调整模糊参数时无需重新推理
+# 关闭后 /filter 不落盘（结果图为未打码原图），返回 result_id=None，/render 不可用
+RESULT_STORE_ENABLED = os.getenv("SAM3_RESULT_STORE_ENABLED", "1").lower() in ("1", "true", "yes")
+RESULT_STORE_DIR = Path(os.getenv("SAM3_RESULT_STORE_DIR", str(PROJECT_ROOT / "cache" / "results")))
+RESULT_STORE_MAX_ITEMS = int(os.getenv("SAM3_RESULT_STORE_MAX_ITEMS", "200"))  # 超出后淘汰最旧的结果
+RESULT_STORE_TTL_SECONDS = int(os.getenv("SAM3_RESULT_STORE_TTL", "3600"))  # 结果过期时间
@@ -3,18 +3,56 @@
 """
 import base64
 from io import BytesIO
-from typing import Tuple
+from typing import Optional, Tuple
 
 import numpy as np
 from PIL import Image
 
+from .buffer_pool import buffer_pool
 from .config import MAX_IMAGE_SIZE
+from .profiling import stage
 
 
 def decode_image_from_bytes(data: bytes) -> np.ndarray:
     """从字节流解码为 numpy 数组 (RGB)"""
-    img = Image.open(BytesIO(data)).convert("RGB")
-    return np.array(img)
+    with stage("decode"):
+        img = Image.open(BytesIO(data)).convert("RGB")
+        return np.array(img)
+
+
+def probe_image_size(data: bytes) -> Tuple[int, int]:
+    """只读取文件头获取图像尺寸 (H, W)，不解码像素"""
+    with Image.open(BytesIO(data)) as img:
+        w, h = img.size
+    return h, w
+
+
+def decode_image_resized(data: bytes, max_size: int = MAX_IMAGE_SIZE) -> Tuple[np.ndarray, float]:
+    """
+    解码并缩放到长边不超过 max_size，结果写入缓冲池借出的数组。
+    等价于 decode_image_from_bytes + resize_if_needed，但：
+    - JPEG 利用 draft 模式在解码时直接按 1/2、1/4、1/8 缩小，不生成全分辨率像素
+    - 缩放在 PIL 内完成，省去全分辨率的 numpy 中间拷贝
+    返回：(缩放后图像, 缩放比例)，图像用完后可通过 buffer_pool.release 归还
+    """
+    with stage("decode"):
+        img = Image.open(BytesIO(data))
+        w, h = img.size
+        max_dim = max(h, w)
+        scale = 1.0
+        new_w, new_h = w, h
+        if max_dim > max_size:
+            scale = max_size / max_dim
+            new_w, new_h = int(w * scale), int(h * scale)
+            img.draft("RGB", (new_w, new_h))  # 仅对 JPEG 生效，保证结果不小于目标尺寸
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        if img.size != (new_w, new_h):
+            img = img.resize((new_w, new_h), Image.LANCZOS)
+
+        out = buffer_pool.acquire((new_h, new_w, 3), np.uint8)
+        out[...] = np.asarray(img)
+        return out, scale
 
 
 def decode_image_from_base64(b64_str: str) -> np.ndarray:
@@ -28,10 +66,11 @@ def decode_image_from_base64(b64_str: str) -> np.ndarray:
 
 def encode_image_to_base64(img: np.ndarray, format: str = "PNG") -> str:
     """将 numpy 数组编码为 base64 字符串（带 data URI 前缀）"""
-    pil_img = Image.fromarray(img.astype(np.uint8))
-    buffer = BytesIO()
-    pil_img.save(buffer, format=format)
-    b64 = base64.b64encode(buffer.getvalue()).decode("utf-8")
+    with stage("encode"):
+        pil_img = Image.fromarray(np.asarray(img, dtype=np.uint8))  # 已是 uint8 时不再拷贝
+        buffer = BytesIO()
+        pil_img.save(buffer, format=format)
+        b64 = base64.b64encode(buffer.getbuffer()).decode("ascii")
     mime = f"image/{format.lower()}"
     return f"data:{mime};base64,{b64}"
 
@@ -50,3 +89,18 @@ def resize_if_needed(img: np.ndarray, max_size: int = MAX_IMAGE_SIZE) -> Tuple[n
     pil_img = Image.fromarray(img)
     resized = pil_img.resize((new_w, new_h), Image.LANCZOS)
     return np.array(resized), scale
+
+
+def mask_bounds(mask: np.ndarray, pad: int = 0) -> Optional[Tuple[slice, slice]]:
+    """
+    mask 的外接矩形（向外扩展 pad 像素并裁剪到图像范围内）。
+    返回 (行切片, 列切片)；mask 为空时返回 None
+    """
+    rows = np.flatnonzero(mask.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(mask.any(axis=0))
+    h, w = mask.shape[:2]
+    y0, y1 = max(0, rows[0] - pad), min(h, rows[-1] + 1 + pad)
+    x0, x1 = max(0, cols[0] - pad), min(w, cols[-1] + 1 + pad)
+    return slice(y0, y1), slice(x0, x1)
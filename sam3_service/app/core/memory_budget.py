@@ -0,0 +1,210 @@
+"""
+请求级内存预估与准入控制
+在解码前根据图像尺寸预估一次请求的峰值内存：超出单请求上限时降低工作分辨率，
+仍然放不下则拒绝；所有进行中请求的预估总量超出进程预算时暂时拒绝（可重试）
+"""
+import threading
+from contextlib import contextmanager
+from typing import Optional, Sequence, Tuple
+
+from .config import (
+    MAX_IMAGE_SIZE,
+    MEMORY_BUDGET_BYTES,
+    MEMORY_ESTIMATE_MAX_MASKS,
+    MIN_IMAGE_SIZE,
+    REQUEST_MEMORY_LIMIT_BYTES,
+)
+
+
+class MemoryBudgetExceeded(RuntimeError):
+    """请求内存超出预算"""
+
+    def __init__(self, message: str, retryable: bool):
+        super().__init__(message)
+        self.retryable = retryable  # True: 进程繁忙，稍后可重试；False: 请求本身过大
+
+
+def working_size(h: int, w: int, max_size: int) -> tuple:
+    """与 resize_if_needed 一致的缩放后尺寸 (H, W)"""
+    max_dim = max(h, w)
+    if max_dim <= max_size:
+        return h, w
+    scale = max_size / max_dim
+    return int(h * scale), int(w * scale)
+
+
+def largest_roi_pixels(rois: Sequence[Tuple[int, int, int, int]], max_size: int) -> int:
+    """各 ROI（原图坐标 x1, y1, x2, y2）裁剪并缩放到 max_size 后的最大像素数"""
+    largest = 0
+    for x1, y1, x2, y2 in rois:
+        h, w = working_size(y2 - y1, x2 - x1, max_size)
+        largest = max(largest, h * w)
+    return largest
+
+
+def expected_mask_count(max_masks: int) -> int:
+    """由调用方的 max_masks 上限得到预估使用的 mask 数量"""
+    return max(0, min(max_masks, MEMORY_ESTIMATE_MAX_MASKS))
+
+
+def estimate_request_bytes(
+    src_h: int,
+    src_w: int,
+    h: int,
+    w: int,
+    num_masks: int,
+    preview: bool = False,
+    render: bool = True,
+    roi_pixels: int = 0,
+    roi_source_pixels: int = 0,
+    full_frame: bool = True,
+) -> int:
+    """
+    粗略估计一次请求的峰值内存（字节）。
+
+    - src_h / src_w：原图尺寸（解码阶段）
+    - h / w：缩放后的工作尺寸（分割、合成、编码阶段）
+    - num_masks：预计返回的 mask 数量（调用方上限先经 expected_mask_count 收敛）
+    - preview：是否生成热力图/轮廓预览
+    - render：是否合成并编码输出图像（只返回 mask 信息的接口为 False）
+    - roi_pixels / roi_source_pixels：ROI 模式下最大 ROI 裁剪图缩放后 / 缩放前的像素数，0 表示非 ROI 模式
+    - full_frame：是否生成工作尺寸的整幅图像与 mask（只需 bbox / area 的 ROI 分割为 False）
+    """
+    frame = h * w * 3
+    pixels = h * w
+    decode = src_h * src_w * 3 * 2  # PIL 解码结果 + 转 numpy 时的临时拷贝
+    segment = frame + num_masks * pixels if full_frame else 0  # 模型输入 + bool mask
+    if roi_pixels:
+        # 当前 ROI 的原分辨率裁剪、缩放后的裁剪图（含临时拷贝）与模型输出，
+        # 加上跨 ROI 保留的前 num_masks 个 ROI 内 mask，以及映射时缩放到目标矩形的单个 mask
+        segment += (
+            roi_source_pixels * 3 + roi_pixels * 3 * 2
+            + 2 * num_masks * roi_pixels + roi_source_pixels
+        )
+    if not render:
+        return decode + segment
+    composite = frame * 3  # 结果图 + 单个 mask 的模糊临时帧
+    if preview:
+        composite += pixels * 3 * 4 + pixels * 8  # float32 预览帧 + 距离场
+    encode = frame * 3  # PIL 拷贝 + PNG 缓冲 + base64
+    return decode + segment + composite + encode
+
+
+class MemoryBudget:
+    """进程级内存预算：记录进行中请求的预估内存，超出时拒绝新请求"""
+
+    def __init__(
+        self,
+        total_bytes: int = MEMORY_BUDGET_BYTES,
+        request_limit_bytes: int = REQUEST_MEMORY_LIMIT_BYTES,
+    ):
+        self.total_bytes = total_bytes
+        self.request_limit_bytes = request_limit_bytes
+        self._in_use = 0
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.downgraded = 0
+
+    def plan_max_size(
+        self,
+        src_h: int,
+        src_w: int,
+        num_masks: int,
+        preview: bool = False,
+        max_size: int = MAX_IMAGE_SIZE,
+        allow_downgrade: bool = True,
+        render: bool = True,
+        rois: Sequence[Tuple[int, int, int, int]] = (),
+        full_frame: bool = True,
+    ) -> int:
+        """
+        选择不超过单请求上限的工作分辨率（长边，同时作为 ROI 裁剪图的长边上限）。
+        每次按 0.75 倍降低，低于 MIN_IMAGE_SIZE 仍放不下时抛出 MemoryBudgetExceeded。
+        """
+        size = max_size
+        while True:
+            nbytes = self._estimate(src_h, src_w, size, num_masks, preview, render, rois, full_frame)
+            if nbytes <= self.request_limit_bytes:
+                if size != max_size:
+                    with self._lock:
+                        self.downgraded += 1
+                return size
+            if not allow_downgrade or size <= MIN_IMAGE_SIZE:
+                with self._lock:
+                    self.rejected += 1
+                raise MemoryBudgetExceeded(
+                    f"Request needs ~{nbytes >> 20} MB, exceeds per-request limit "
+                    f"of {self.request_limit_bytes >> 20} MB",
+                    retryable=False,
+                )
+            size = max(MIN_IMAGE_SIZE, int(size * 0.75))
+
+    @staticmethod
+    def _estimate(src_h, src_w, size, num_masks, preview, render, rois, full_frame) -> int:
+        h, w = working_size(src_h, src_w, size)
+        return estimate_request_bytes(
+            src_h, src_w, h, w, num_masks, preview, render,
+            roi_pixels=largest_roi_pixels(rois, size),
+            roi_source_pixels=largest_roi_pixels(rois, max(src_h, src_w)),
+            full_frame=full_frame,
+        )
+
+    @contextmanager
+    def reserve(self, nbytes: int):
+        """在进程预算中预留 nbytes，退出上下文时释放"""
+        with self._lock:
+            if self._in_use + nbytes > self.total_bytes and self._in_use > 0:
+                self.rejected += 1
+                raise MemoryBudgetExceeded(
+                    f"Server busy: {self._in_use >> 20} MB in flight, "
+                    f"budget {self.total_bytes >> 20} MB",
+                    retryable=True,
+                )
+            self._in_use += nbytes
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_use -= nbytes
+
+    @contextmanager
+    def admit(
+        self,
+        src_h: int,
+        src_w: int,
+        num_masks: int,
+        preview: bool = False,
+        max_size: Optional[int] = MAX_IMAGE_SIZE,
+        render: bool = True,
+        rois: Sequence[Tuple[int, int, int, int]] = (),
+        full_frame: bool = True,
+    ):
+        """
+        准入控制：确定工作分辨率并预留内存，返回实际使用的 max_size。
+        max_size 为 None 表示不缩放（只做拒绝，不做降级）。
+        rois 非空时同时计入逐个 ROI 分割的内存；full_frame=False 表示不生成整幅图像与 mask。
+        """
+        options = dict(render=render, rois=rois, full_frame=full_frame)
+        if max_size is None:
+            size = self.plan_max_size(
+                src_h, src_w, num_masks, preview,
+                max_size=max(src_h, src_w), allow_downgrade=False, **options,
+            )
+        else:
+            size = self.plan_max_size(src_h, src_w, num_masks, preview, max_size=max_size, **options)
+        with self.reserve(self._estimate(src_h, src_w, size, num_masks, preview, render, rois, full_frame)):
+            yield size
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "in_use_bytes": self._in_use,
+                "total_bytes": self.total_bytes,
+                "request_limit_bytes": self.request_limit_bytes,
+                "rejected": self.rejected,
+                "downgraded": self.downgraded,
+            }
+
+
+# 全局实例
+memory_budget = MemoryBudget()
@@ -0,0 +1,312 @@
+"""
+多设备模型池
+每个配置的设备（或 CPU 分片）一个 SAM3Model 副本，请求路由到最空闲的副本，
+同一张图片优先路由到上次处理它的副本以复用图像编码缓存；
+支持逐个副本排空、热加载而不中断服务
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import List, Optional
+
+import numpy as np
+
+from .config import (
+    CPU_THREADS,
+    DEVICES,
+    MODEL_AFFINITY_CACHE_SIZE,
+    MODEL_AFFINITY_SLACK,
+    MODEL_ROUTE_TIMEOUT,
+    MODEL_UTILIZATION_WINDOW,
+    SAM3_MODE,
+)
+from .profiling import stage
+from .sam3_model import MaskResult, SAM3Model
+
+
+# 副本状态
+ACTIVE = "active"  # 正常接收请求
+DRAINING = "draining"  # 不再接收新请求，等待进行中请求完成
+RELOADING = "reloading"  # 正在重新加载
+FAILED = "failed"  # 加载失败
+
+
+def image_fingerprint(image: np.ndarray) -> str:
+    """图像内容指纹，用于副本亲和与图像编码缓存"""
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str(image.shape).encode())
+    h.update(np.ascontiguousarray(image).data)
+    return h.hexdigest()
+
+
+class ModelReplica:
+    """单个模型副本及其负载统计"""
+
+    def __init__(self, index: int, device: str):
+        self.index = index
+        self.device = device
+        self.model = SAM3Model(device=device)
+        self.state = ACTIVE
+        self.inflight = 0  # 已路由到该副本、尚未完成的请求数（含排队）
+        self.requests = 0
+        self.errors = 0
+        self.busy_seconds = 0.0
+        self.loaded_at = time.time()
+        self.lock = threading.Lock()  # 模型非线程安全，同一时刻只处理一个请求
+        # 最近 MODEL_UTILIZATION_WINDOW 秒内的忙碌区间 (start, end)，time.monotonic 时间
+        self._busy_intervals: deque = deque()
+        self._busy_since: Optional[float] = None  # 正在处理的请求的开始时间
+        self._window_start = time.monotonic()
+
+    def begin_busy(self) -> float:
+        self._busy_since = time.monotonic()
+        return self._busy_since
+
+    def end_busy(self, start: float) -> float:
+        """记录一次忙碌区间，返回其时长"""
+        end = time.monotonic()
+        self._busy_since = None
+        self._busy_intervals.append((start, end))
+        while self._busy_intervals and self._busy_intervals[0][1] < end - MODEL_UTILIZATION_WINDOW:
+            self._busy_intervals.popleft()
+        return end - start
+
+    def reset_window(self) -> None:
+        """重新开始利用率统计（副本重新加载后）"""
+        self._busy_intervals.clear()
+        self._window_start = time.monotonic()
+
+    def utilization(self) -> float:
+        """最近 MODEL_UTILIZATION_WINDOW 秒内（含进行中请求）的忙碌时间占比"""
+        now = time.monotonic()
+        window_start = max(now - MODEL_UTILIZATION_WINDOW, self._window_start)
+        intervals = list(self._busy_intervals)
+        busy_since = self._busy_since
+        if busy_since is not None:
+            intervals.append((busy_since, now))
+        busy = sum(max(0.0, end - max(start, window_start)) for start, end in intervals)
+        return min(busy / max(now - window_start, 1e-6), 1.0)
+
+    def stats(self) -> dict:
+        return {
+            "index": self.index,
+            "device": self.device,
+            "state": self.state,
+            "loaded": self.model.is_loaded,
+            "inflight": self.inflight,
+            "requests": self.requests,
+            "errors": self.errors,
+            "busy_seconds": round(self.busy_seconds, 3),
+            "utilization": round(self.utilization(), 4),
+            "avg_latency_ms": round(self.busy_seconds * 1000 / self.requests, 2) if self.requests else 0.0,
+            "loaded_at": self.loaded_at,
+        }
+
+
+class ModelPool:
+    """
+    模型副本池，对外提供与 SAM3Model 相同的 segment_auto / segment_with_prompts 接口。
+
+    路由规则：
+    1. 只在 ACTIVE 副本中选择；没有 ACTIVE 副本时退而使用（手动排空的）DRAINING 副本；
+       都没有（如单副本热加载中）时等待，超时抛出 RuntimeError
+    2. 图片上次路由到的副本仍可用，且其排队数不超过最空闲副本 + MODEL_AFFINITY_SLACK 时，优先使用它
+    3. 否则选择 inflight 最少的副本（相同时选累计请求最少的）
+    """
+
+    def __init__(self, devices: List[str] = DEVICES):
+        self.replicas = [ModelReplica(i, d) for i, d in enumerate(devices)]
+        self._cond = threading.Condition()
+        self._affinity: "OrderedDict[str, int]" = OrderedDict()
+        self._reload_lock = threading.Lock()  # 同一时刻只热加载一个副本
+
+    def load(self) -> bool:
+        """加载全部副本"""
+        if SAM3_MODE == "real" and CPU_THREADS is not None:
+            # 同进程内的 CPU 副本共享 torch 线程池设置，按副本数均分核数
+            import torch
+            torch.set_num_threads(CPU_THREADS)
+            print(f"[ModelPool] torch intra-op threads: {CPU_THREADS}")
+        for r in self.replicas:
+            self._load_replica(r)
+        if not self.is_loaded:
+            raise RuntimeError("No model replica loaded successfully.")
+        return True
+
+    def _load_replica(self, replica: ModelReplica) -> None:
+        try:
+            replica.model.load()
+            state = ACTIVE
+        except Exception as e:
+            print(f"[ModelPool] Replica {replica.index} ({replica.device}) failed to load: {e}")
+            state = FAILED
+        with self._cond:
+            replica.state = state
+            replica.loaded_at = time.time()
+            replica.reset_window()
+            self._cond.notify_all()
+
+    @property
+    def is_loaded(self) -> bool:
+        return any(r.model.is_loaded and r.state != FAILED for r in self.replicas)
+
+    def _pick(self, image_key: Optional[str]) -> Optional[ModelReplica]:
+        """在持有 _cond 的情况下选择副本"""
+        candidates = [r for r in self.replicas if r.state == ACTIVE]
+        if not candidates:
+            candidates = [r for r in self.replicas if r.state == DRAINING]
+        if not candidates:
+            return None
+
+        least = min(candidates, key=lambda r: (r.inflight, r.requests))
+        chosen = least
+        if image_key is not None and image_key in self._affinity:
+            preferred = self.replicas[self._affinity[image_key]]
+            if preferred in candidates and preferred.inflight <= least.inflight + MODEL_AFFINITY_SLACK:
+                chosen = preferred
+
+        if image_key is not None:
+            self._affinity[image_key] = chosen.index
+            self._affinity.move_to_end(image_key)
+            while len(self._affinity) > MODEL_AFFINITY_CACHE_SIZE:
+                self._affinity.popitem(last=False)
+        return chosen
+
+    @contextmanager
+    def route(self, image_key: Optional[str] = None):
+        """选择副本并独占使用，退出时更新负载统计"""
+        deadline = time.monotonic() + MODEL_ROUTE_TIMEOUT
+        with self._cond:
+            while True:
+                replica = self._pick(image_key)
+                if replica is not None:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise RuntimeError("No model replica available.")
+                self._cond.wait(remaining)
+            replica.inflight += 1
+
+        failed = False
+        elapsed = 0.0
+        try:
+            with stage("model_wait"):
+                replica.lock.acquire()
+            start = replica.begin_busy()
+            try:
+                yield replica.model
+            except Exception:
+                failed = True
+                raise
+            finally:
+                elapsed = replica.end_busy(start)
+                replica.lock.release()
+        finally:
+            with self._cond:
+                replica.inflight -= 1
+                replica.requests += 1
+                replica.busy_seconds += elapsed
+                if failed:
+                    replica.errors += 1
+                self._cond.notify_all()
+
+    def segment_auto(
+        self,
+        image: np.ndarray,
+        min_area_ratio: float = 0.01,
+        max_masks: int = 50,
+        text_prompt: str = "all objects",
+    ) -> List[MaskResult]:
+        """自动分割，路由到某个副本执行"""
+        image_key = image_fingerprint(image)
+        with self.route(image_key) as model, stage("segment"):
+            return model.segment_auto(
+                image,
+                min_area_ratio=min_area_ratio,
+                max_masks=max_masks,
+                text_prompt=text_prompt,
+                image_key=image_key,
+            )
+
+    def segment_with_prompts(
+        self,
+        image: np.ndarray,
+        points: Optional[List[dict]] = None,
+        boxes: Optional[List[dict]] = None,
+    ) -> List[MaskResult]:
+        """基于 prompt 的分割，路由到某个副本执行"""
+        with self.route(image_fingerprint(image)) as model:
+            return model.segment_with_prompts(image, points=points, boxes=boxes)
+
+    def _get_replica(self, index: int) -> ModelReplica:
+        if not 0 <= index < len(self.replicas):
+            raise IndexError(f"Replica index out of range: {index}")
+        return self.replicas[index]
+
+    def drain(self, index: int, timeout: float = MODEL_ROUTE_TIMEOUT) -> bool:
+        """
+        排空副本：不再路由新请求，等待进行中请求完成。
+        返回是否在 timeout 内排空；副本保持 DRAINING 直到 resume 或 reload。
+        """
+        replica = self._get_replica(index)
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            if replica.state == ACTIVE:
+                replica.state = DRAINING
+            while replica.inflight > 0:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def resume(self, index: int) -> None:
+        """恢复排空中的副本"""
+        replica = self._get_replica(index)
+        with self._cond:
+            if replica.state == DRAINING and replica.model.is_loaded:
+                replica.state = ACTIVE
+                self._cond.notify_all()
+
+    def reload(self, index: int, timeout: float = MODEL_ROUTE_TIMEOUT) -> dict:
+        """
+        热加载单个副本：排空 -> 卸载 -> 重新加载 -> 恢复。
+        排空期间副本即处于 RELOADING，不会作为 DRAINING 兜底继续接收请求；
+        其余副本在此期间继续服务，只有一个副本时，请求会等待其加载完成。
+        """
+        replica = self._get_replica(index)
+        deadline = time.monotonic() + timeout
+        with self._reload_lock:
+            with self._cond:
+                prev_state = replica.state
+                replica.state = RELOADING
+                while replica.inflight > 0:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        replica.state = prev_state
+                        self._cond.notify_all()
+                        raise TimeoutError(f"Replica {index} did not drain within {timeout}s")
+                    self._cond.wait(remaining)
+                # 亲和记录指向的图像编码缓存即将失效
+                for key in [k for k, v in self._affinity.items() if v == index]:
+                    del self._affinity[key]
+            # 持有副本锁替换模型，保证不会与仍持有旧模型的请求交错
+            with replica.lock:
+                replica.model.unload()
+                replica.model = SAM3Model(device=replica.device)
+                self._load_replica(replica)
+        return replica.stats()
+
+    def reload_all(self, timeout: float = MODEL_ROUTE_TIMEOUT) -> List[dict]:
+        """逐个热加载全部副本"""
+        return [self.reload(r.index, timeout) for r in self.replicas]
+
+    def stats(self) -> List[dict]:
+        with self._cond:
+            return [r.stats() for r in self.replicas]
+
+
+# 全局实例
+model_pool = ModelPool()
@@ -1,14 +1,20 @@
 """
 隐私过滤流水线
 """
-from dataclasses import dataclass
-from typing import List, Literal
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import List, Literal, Optional, Tuple
 
 import numpy as np
 from PIL import Image, ImageFilter
 
-from .config import AUTO_MASK_MIN_AREA_RATIO, DEFAULT_BLUR_STRENGTH
-from .sam3_model import sam3_model, MaskResult
+from .buffer_pool import buffer_pool
+from .config import AUTO_MASK_MIN_AREA_RATIO, DEFAULT_BLUR_STRENGTH, MAX_IMAGE_SIZE
+from .image_io import mask_bounds
+from .profiling import stage
+from .roi import segment_rois
+from .model_pool import model_pool
+from .sam3_model import MaskResult
 
 
 BlurType = Literal["gaussian", "pixelate", "solid"]
@@ -27,41 +33,76 @@ class PrivacyFilterResult:
     """隐私过滤结果"""
     filtered_image: np.ndarray
     applied_regions: List[AppliedRegion]
+    masks: List[MaskResult] = field(default_factory=list)  # 分割结果，供结果存储复用
+
+
+def _prepare_output(image: np.ndarray, out: Optional[np.ndarray]) -> np.ndarray:
+    """out 为 None 时返回 image 的拷贝；否则把 image 写入 out（out 可以就是 image，原地修改）"""
+    if out is None:
+        return image.copy()
+    if out is not image:
+        np.copyto(out, image)
+    return out
 
 
 def apply_gaussian_blur(
     image: np.ndarray,
     mask: np.ndarray,
     strength: int = DEFAULT_BLUR_STRENGTH,
+    out: Optional[np.ndarray] = None,
 ) -> np.ndarray:
-    """对 mask 区域应用高斯模糊"""
-    pil_img = Image.fromarray(image)
-    blurred = pil_img.filter(ImageFilter.GaussianBlur(radius=strength))
-    blurred_arr = np.array(blurred)
+    """
+    对 mask 区域应用高斯模糊。
+    只对 mask 外接矩形（外扩 3 倍半径，覆盖模糊核）做模糊，不生成整帧模糊图。
+    """
+    result = _prepare_output(image, out)
+    bounds = mask_bounds(mask, pad=3 * strength)
+    if bounds is None:
+        return result
+    
+    crop = Image.fromarray(np.ascontiguousarray(result[bounds]))
+    blurred_arr = np.asarray(crop.filter(ImageFilter.GaussianBlur(radius=strength)))
     
-    result = image.copy()
-    result[mask] = blurred_arr[mask]
+    sub_mask = mask[bounds]
+    result[bounds][sub_mask] = blurred_arr[sub_mask]
     return result
 
 
+@lru_cache(maxsize=256)
+def _nearest_index(n: int, m: int) -> np.ndarray:
+    """PIL NEAREST 将长度 n 缩放到 m 时，每个输出位置取的源下标"""
+    line = Image.fromarray(np.arange(n, dtype=np.int32).reshape(1, n), "I")
+    return np.asarray(line.resize((m, 1), Image.NEAREST))[0]
+
+
 def apply_pixelate(
     image: np.ndarray,
     mask: np.ndarray,
     strength: int = DEFAULT_BLUR_STRENGTH,
+    out: Optional[np.ndarray] = None,
 ) -> np.ndarray:
-    """对 mask 区域应用像素化（马赛克）"""
+    """
+    对 mask 区域应用像素化（马赛克）。
+    与 PIL 先缩小再放大（NEAREST）结果一致，但只按下标映射取 mask 内的像素，
+    不生成整帧的缩小图和放大图。
+    """
     h, w = image.shape[:2]
-    pil_img = Image.fromarray(image)
+    bounds = mask_bounds(mask)
+    if bounds is None:
+        return _prepare_output(image, out)
     
-    # 像素化：先缩小再放大
+    # 像素化：先缩小再放大，两次 NEAREST 复合为输出位置 -> 源像素的下标映射
     block_size = max(4, strength)
     small_w, small_h = max(1, w // block_size), max(1, h // block_size)
-    small = pil_img.resize((small_w, small_h), Image.NEAREST)
-    pixelated = small.resize((w, h), Image.NEAREST)
-    pixelated_arr = np.array(pixelated)
+    rows = _nearest_index(h, small_h)[_nearest_index(small_h, h)[bounds[0]]]
+    cols = _nearest_index(w, small_w)[_nearest_index(small_w, w)[bounds[1]]]
     
-    result = image.copy()
-    result[mask] = pixelated_arr[mask]
+    sub_mask = mask[bounds]
+    yy, xx = np.nonzero(sub_mask)
+    pixelated = image[rows[yy], cols[xx]]  # 先取出，out 可能就是 image
+    
+    result = _prepare_output(image, out)
+    result[bounds][sub_mask] = pixelated
     return result
 
 
@@ -69,9 +110,10 @@ def apply_solid_color(
     image: np.ndarray,
     mask: np.ndarray,
     color: tuple = (0, 0, 0),
+    out: Optional[np.ndarray] = None,
 ) -> np.ndarray:
     """对 mask 区域填充纯色"""
-    result = image.copy()
+    result = _prepare_output(image, out)
     result[mask] = color
     return result
 
@@ -94,23 +136,82 @@ class PrivacyPipeline:
         3. 对每个 mask 应用模糊/遮挡
         """
         # 获取自动分割结果（支持文本提示词）
-        masks: List[MaskResult] = sam3_model.segment_auto(
+        masks: List[MaskResult] = model_pool.segment_auto(
             image,
             min_area_ratio=min_area_ratio,
             text_prompt=text_prompt,
         )
         
-        # 应用模糊
-        result_image = image.copy()
+        result = self.composite(image, masks, blur_type, blur_strength)
+        result.masks = masks
+        return result
+    
+    def filter_rois(
+        self,
+        image: np.ndarray,
+        source: np.ndarray,
+        rois: List[Tuple[int, int, int, int]],
+        scale: float = 1.0,
+        blur_type: BlurType = "gaussian",
+        blur_strength: int = DEFAULT_BLUR_STRENGTH,
+        min_area_ratio: float = AUTO_MASK_MIN_AREA_RATIO,
+        text_prompt: str = "all objects",
+        max_size: Optional[int] = MAX_IMAGE_SIZE,
+    ) -> PrivacyFilterResult:
+        """
+        ROI 模式隐私过滤：
+        1. 从原图 source 裁剪每个 ROI，单独缩放后分割（见 roi.segment_rois）
+        2. mask 映射回输出图像 image（相对 source 的缩放比例为 scale）
+        3. 在 image 上应用模糊/遮挡，ROI 以外的区域保持不变
+        """
+        masks = segment_rois(
+            source,
+            rois,
+            out_shape=image.shape[:2],
+            scale=scale,
+            min_area_ratio=min_area_ratio,
+            text_prompt=text_prompt,
+            max_size=max_size,
+        )
+        
+        result = self.composite(image, masks, blur_type, blur_strength)
+        result.masks = masks
+        return result
+    
+    def composite(
+        self,
+        image: np.ndarray,
+        masks: List[MaskResult],
+        blur_type: BlurType = "gaussian",
+        blur_strength: int = DEFAULT_BLUR_STRENGTH,
+    ) -> PrivacyFilterResult:
+        """
+        合成步骤：对给定的 mask 逐个应用模糊/遮挡，不涉及模型推理。
+        可用于对已存储的分割结果重新渲染。
+        
+        结果图从 buffer_pool 借出并原地合成，调用方编码完成后应归还。
+        """
+        with stage("composite"):
+            return self._composite(image, masks, blur_type, blur_strength)
+    
+    def _composite(
+        self,
+        image: np.ndarray,
+        masks: List[MaskResult],
+        blur_type: BlurType,
+        blur_strength: int,
+    ) -> PrivacyFilterResult:
+        result_image = buffer_pool.acquire(image.shape, np.uint8)
+        np.copyto(result_image, image)
         applied_regions: List[AppliedRegion] = []
         
         for m in masks:
             if blur_type == "gaussian":
-                result_image = apply_gaussian_blur(result_image, m.mask, blur_strength)
+                apply_gaussian_blur(result_image, m.mask, blur_strength, out=result_image)
             elif blur_type == "pixelate":
-                result_image = apply_pixelate(result_image, m.mask, blur_strength)
+                apply_pixelate(result_image, m.mask, blur_strength, out=result_image)
             elif blur_type == "solid":
-                result_image = apply_solid_color(result_image, m.mask)
+                apply_solid_color(result_image, m.mask, out=result_image)
             
             applied_regions.append(AppliedRegion(
                 mask_id=m.mask_id,
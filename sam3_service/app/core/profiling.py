@@ -0,0 +1,165 @@
+"""
+性能诊断工具
+- 请求分阶段计时：trace_request 包裹一次请求，stage 记录各阶段耗时（跨线程池传递）
+- 慢请求采集：总耗时超过阈值的请求进入定长环形缓冲，可导出后离线回放
+- 采样分析器：按固定间隔采样所有线程调用栈，输出 flamegraph 可用的 folded 格式
+"""
+import base64
+import hashlib
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from .config import (
+    SLOW_REQUEST_BUFFER_SIZE,
+    SLOW_REQUEST_CAPTURE_INPUT,
+    SLOW_REQUEST_THRESHOLD_MS,
+)
+
+
+@dataclass
+class RequestTrace:
+    """一次请求的分阶段耗时与上下文"""
+    endpoint: str
+    params: dict
+    started_at: float = field(default_factory=time.time)
+    stages: Dict[str, float] = field(default_factory=dict)  # 阶段名 -> 毫秒（同名阶段累加）
+    info: dict = field(default_factory=dict)  # image_size / mask_count 等
+    total_ms: float = 0.0
+    error: Optional[str] = None
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("sam3_request_trace", default=None)
+
+
+@contextmanager
+def stage(name: str):
+    """记录当前请求中一个阶段的耗时；不在 trace_request 中时不做任何事"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = (time.perf_counter() - start) * 1000
+        trace.stages[name] = trace.stages.get(name, 0.0) + elapsed
+
+
+def annotate(**info) -> None:
+    """为当前请求补充信息（如 image_size、mask_count）"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.info.update(info)
+
+
+class SlowRequestRecorder:
+    """慢请求环形缓冲"""
+
+    def __init__(
+        self,
+        threshold_ms: float = SLOW_REQUEST_THRESHOLD_MS,
+        max_items: int = SLOW_REQUEST_BUFFER_SIZE,
+        capture_input: bool = SLOW_REQUEST_CAPTURE_INPUT,
+    ):
+        self.threshold_ms = threshold_ms
+        self.capture_input = capture_input
+        self._records: deque = deque(maxlen=max_items)
+        self._lock = threading.Lock()
+
+    def maybe_record(self, trace: RequestTrace, data: Optional[bytes]) -> None:
+        """总耗时超过阈值时记录"""
+        if trace.total_ms < self.threshold_ms:
+            return
+        record = {
+            "endpoint": trace.endpoint,
+            "timestamp": trace.started_at,
+            "total_ms": round(trace.total_ms, 2),
+            "stages": {k: round(v, 2) for k, v in trace.stages.items()},
+            "params": trace.params,
+            **trace.info,
+            "error": trace.error,
+            "input_sha256": hashlib.sha256(data).hexdigest() if data is not None else None,
+            "input_size": len(data) if data is not None else 0,
+            "input": data if self.capture_input else None,
+        }
+        with self._lock:
+            self._records.append(record)
+
+    def records(self, include_input: bool = False) -> List[dict]:
+        """返回已记录的慢请求（从旧到新）；include_input 时输入以 base64 字符串返回"""
+        with self._lock:
+            records = list(self._records)
+        result = []
+        for r in records:
+            r = dict(r)
+            data = r.pop("input")
+            if include_input:
+                r["input_base64"] = base64.b64encode(data).decode("ascii") if data is not None else None
+            result.append(r)
+        return result
+
+    def clear(self) -> None:
+        with self._lock:
+            self._records.clear()
+
+
+# 全局实例
+slow_request_recorder = SlowRequestRecorder()
+
+
+@contextmanager
+def trace_request(endpoint: str, data: Optional[bytes], params: dict):
+    """
+    包裹一次请求：在上下文中启用 stage 计时，结束时交给 slow_request_recorder。
+    data 为原始输入字节（用于计算指纹，开启采集时保存原文）。
+    """
+    trace = RequestTrace(endpoint=endpoint, params=params)
+    token = _current_trace.set(trace)
+    start = time.perf_counter()
+    try:
+        yield trace
+    except Exception as e:
+        trace.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        trace.total_ms = (time.perf_counter() - start) * 1000
+        _current_trace.reset(token)
+        slow_request_recorder.maybe_record(trace, data)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename}:{frame.f_lineno})"
+
+
+def sample_profile(seconds: float, interval: float = 0.01) -> str:
+    """
+    在 seconds 秒内每隔 interval 秒采样一次所有线程的调用栈（不含采样线程自身），
+    返回 folded stacks 文本：每行 "线程;栈底;...;栈顶 次数"，
+    可直接用于 flamegraph.pl、speedscope 等工具。
+    """
+    counts: Counter = Counter()
+    me = threading.get_ident()
+    names = {}
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for t in threading.enumerate():
+            names[t.ident] = t.name
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}"))
+            counts[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+    return "\n".join(f"{stack} {n}" for stack, n in counts.most_common()) + "\n"
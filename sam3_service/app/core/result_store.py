@@ -0,0 +1,190 @@
+"""
+分割结果存储
+将一次分割的原图、压缩 mask 与分数落盘，后续可在不重新推理的情况下重新渲染
+"""
+import json
+import os
+import shutil
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+from .config import (
+    RESULT_STORE_DIR,
+    RESULT_STORE_ENABLED,
+    RESULT_STORE_MAX_ITEMS,
+    RESULT_STORE_TTL_SECONDS,
+)
+from .profiling import stage
+from .sam3_model import MaskResult
+
+
+IMAGE_FILE = "image.npy"
+MASKS_FILE = "masks.npy"
+META_FILE = "meta.json"
+
+
+@dataclass
+class StoredResult:
+    """已存储的分割结果"""
+    result_id: str
+    image: np.ndarray  # (H, W, 3) uint8，只读 memmap
+    masks: List[MaskResult]
+
+
+class ResultStore:
+    """
+    基于本地目录的结果存储。
+
+    每个结果一个子目录：
+    - image.npy：原图 (H, W, 3) uint8
+    - masks.npy：按行 packbits 压缩的 mask (N, H, ceil(W/8)) uint8
+    - meta.json：图像尺寸与每个 mask 的 id / bbox / area / score
+
+    读取时使用 np.load(mmap_mode="r")，数据由操作系统页缓存共享，
+    多个 worker 进程可直接复用同一份结果而无需拷贝。
+    """
+
+    def __init__(
+        self,
+        root: Path = RESULT_STORE_DIR,
+        max_items: int = RESULT_STORE_MAX_ITEMS,
+        ttl_seconds: int = RESULT_STORE_TTL_SECONDS,
+        enabled: bool = RESULT_STORE_ENABLED,
+    ):
+        self.root = Path(root)
+        self.enabled = enabled
+        self.max_items = max_items
+        self.ttl_seconds = ttl_seconds
+
+    def _result_dir(self, result_id: str) -> Path:
+        # result_id 由 uuid4().hex 生成，拒绝其他格式，避免路径穿越
+        if len(result_id) != 32 or not all(c in "0123456789abcdef" for c in result_id):
+            raise KeyError(result_id)
+        return self.root / result_id
+
+    def save(self, image: np.ndarray, masks: List[MaskResult]) -> str:
+        """保存分割结果，返回 result_id"""
+        with stage("store"):
+            return self._save(image, masks)
+
+    def _save(self, image: np.ndarray, masks: List[MaskResult]) -> str:
+        self.root.mkdir(parents=True, exist_ok=True)
+        result_id = uuid.uuid4().hex
+        h, w = image.shape[:2]
+
+        # 先写入临时目录，再整体 rename，避免其他 worker 读到半成品
+        tmp_dir = self.root / f".tmp-{result_id}"
+        tmp_dir.mkdir()
+        try:
+            np.save(tmp_dir / IMAGE_FILE, np.ascontiguousarray(image, dtype=np.uint8))
+
+            packed = np.zeros((len(masks), h, (w + 7) // 8), dtype=np.uint8)
+            for i, m in enumerate(masks):
+                packed[i] = np.packbits(m.mask.astype(bool), axis=-1)
+            np.save(tmp_dir / MASKS_FILE, packed)
+
+            meta = {
+                "image_size": [h, w],
+                "created_at": time.time(),
+                "masks": [
+                    {
+                        "mask_id": m.mask_id,
+                        "bbox": [int(v) for v in m.bbox],
+                        "area": int(m.area),
+                        "score": float(m.score),
+                    }
+                    for m in masks
+                ],
+            }
+            with open(tmp_dir / META_FILE, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+
+            os.replace(tmp_dir, self.root / result_id)
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        self.evict()
+        return result_id
+
+    def load(
+        self,
+        result_id: str,
+        min_score: float = 0.0,
+        mask_ids: Optional[Iterable[int]] = None,
+    ) -> StoredResult:
+        """
+        读取分割结果；不存在或已过期时抛出 KeyError。
+        只解压 score 不低于 min_score 且（给定 mask_ids 时）id 在其中的 mask。
+        """
+        with stage("load"):
+            return self._load(result_id, min_score, mask_ids)
+
+    def _load(
+        self,
+        result_id: str,
+        min_score: float,
+        mask_ids: Optional[Iterable[int]],
+    ) -> StoredResult:
+        result_dir = self._result_dir(result_id)
+        # 其他请求 / worker 可能随时淘汰该结果，文件缺失一律视为不存在
+        try:
+            with open(result_dir / META_FILE, encoding="utf-8") as f:
+                meta = json.load(f)
+            if self.ttl_seconds > 0 and time.time() - meta["created_at"] > self.ttl_seconds:
+                raise KeyError(result_id)
+            image = np.load(result_dir / IMAGE_FILE, mmap_mode="r")
+            packed = np.load(result_dir / MASKS_FILE, mmap_mode="r")
+        except OSError:
+            raise KeyError(result_id)
+
+        h, w = meta["image_size"]
+
+        # 先按 meta 过滤，未选中的 mask 不解压
+        selected = None if mask_ids is None else set(mask_ids)
+        masks = [
+            MaskResult(
+                mask_id=info["mask_id"],
+                mask=np.unpackbits(packed[i], axis=-1, count=w).astype(bool),
+                bbox=tuple(info["bbox"]),
+                area=info["area"],
+                score=info["score"],
+            )
+            for i, info in enumerate(meta["masks"])
+            if info["score"] >= min_score and (selected is None or info["mask_id"] in selected)
+        ]
+        return StoredResult(result_id=result_id, image=image, masks=masks)
+
+    def delete(self, result_id: str) -> None:
+        """删除分割结果"""
+        shutil.rmtree(self._result_dir(result_id), ignore_errors=True)
+
+    def evict(self) -> None:
+        """淘汰过期结果，并将结果数量控制在 max_items 以内（按修改时间从旧到新）"""
+        if not self.root.exists():
+            return
+        entries = []
+        for d in self.root.iterdir():
+            if not d.is_dir() or d.name.startswith("."):
+                continue
+            try:
+                entries.append((d.stat().st_mtime, d))
+            except FileNotFoundError:
+                continue  # 其他 worker 已删除
+        entries.sort()
+
+        now = time.time()
+        excess = len(entries) - self.max_items
+        for i, (mtime, d) in enumerate(entries):
+            expired = self.ttl_seconds > 0 and now - mtime > self.ttl_seconds
+            if i < excess or expired:
+                shutil.rmtree(d, ignore_errors=True)
+
+
+# 全局实例
+result_store = ResultStore()
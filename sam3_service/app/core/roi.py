@@ -0,0 +1,147 @@
+"""
+感兴趣区域（ROI）处理
+只对调用方指定的矩形区域做分割：每个 ROI 从原图裁剪后单独缩放到工作分辨率，
+比整图缩放保留更多细节，且推理开销与 ROI 面积而非整图面积成正比；
+得到的 mask / bbox 再映射回输出图像坐标
+"""
+import heapq
+import json
+from typing import List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+from .config import AUTO_MASK_MIN_AREA_RATIO, AUTO_MASK_MAX_COUNT, MAX_IMAGE_SIZE, MAX_ROI_COUNT
+from .image_io import resize_if_needed
+from .model_pool import model_pool
+from .sam3_model import MaskResult
+
+
+Rect = Tuple[int, int, int, int]  # (x1, y1, x2, y2)，左上闭右下开
+
+
+def parse_rois(rois: Optional[str], width: int, height: int) -> List[Rect]:
+    """
+    解析 ROI JSON：[{"x1":..., "y1":..., "x2":..., "y2":...}, ...]（原图像素坐标）。
+    坐标裁剪到图像范围内，空字符串 / None 返回空列表；
+    格式错误、坐标非有限数、ROI 超过 MAX_ROI_COUNT 个或裁剪后为空时抛出 ValueError。
+    """
+    if not rois:
+        return []
+    try:
+        items = json.loads(rois)
+        rects = [
+            (int(r["x1"]), int(r["y1"]), int(r["x2"]), int(r["y2"]))
+            for r in items
+        ]
+    except (ValueError, TypeError, KeyError, OverflowError) as e:
+        # OverflowError：1e999 等解析为 inf 的坐标
+        raise ValueError(f"rois must be a JSON list of {{x1, y1, x2, y2}} objects: {e}")
+    if len(rects) > MAX_ROI_COUNT:
+        raise ValueError(f"Too many ROIs: {len(rects)} > {MAX_ROI_COUNT}")
+
+    result = []
+    for x1, y1, x2, y2 in rects:
+        x1, x2 = sorted((min(max(x1, 0), width), min(max(x2, 0), width)))
+        y1, y2 = sorted((min(max(y1, 0), height), min(max(y2, 0), height)))
+        if x2 - x1 < 1 or y2 - y1 < 1:
+            raise ValueError(f"ROI is empty after clipping to image bounds: {(x1, y1, x2, y2)}")
+        result.append((x1, y1, x2, y2))
+    return result
+
+
+def _resize_mask(mask: np.ndarray, target: Rect) -> np.ndarray:
+    """将 ROI 内的 mask 缩放到目标矩形大小"""
+    tx1, ty1, tx2, ty2 = target
+    if mask.shape != (ty2 - ty1, tx2 - tx1):
+        pil_mask = Image.fromarray(mask.astype(np.uint8) * 255)
+        mask = np.asarray(pil_mask.resize((tx2 - tx1, ty2 - ty1), Image.NEAREST)) > 127
+    return mask.astype(bool, copy=False)
+
+
+def _map_mask(
+    mask: np.ndarray,
+    target: Rect,
+    out_shape: Tuple[int, int],
+) -> np.ndarray:
+    """将 ROI 内的 mask 缩放到目标矩形并放入整幅输出图像大小的 mask"""
+    tx1, ty1, tx2, ty2 = target
+    full = np.zeros(out_shape, dtype=bool)
+    full[ty1:ty2, tx1:tx2] = _resize_mask(mask, target)
+    return full
+
+
+def segment_rois(
+    source: np.ndarray,
+    rois: List[Rect],
+    out_shape: Tuple[int, int],
+    scale: float = 1.0,
+    min_area_ratio: float = AUTO_MASK_MIN_AREA_RATIO,
+    max_masks: int = AUTO_MASK_MAX_COUNT,
+    text_prompt: str = "all objects",
+    max_size: Optional[int] = MAX_IMAGE_SIZE,
+    expand_masks: bool = True,
+) -> List[MaskResult]:
+    """
+    逐个 ROI 分割并合并结果。
+
+    - source：原图（ROI 坐标所在的坐标系）
+    - out_shape / scale：输出图像尺寸 (H, W) 及其相对原图的缩放比例
+    - min_area_ratio：相对 ROI 面积的最小 mask 占比
+    - max_size：每个 ROI 裁剪后的长边上限，None 表示不缩放
+    - expand_masks：为 False 时不展开为整幅 mask，返回的 mask 为 ROI 裁剪图内的原始 mask
+      （只需 bbox / area 时使用）
+    返回的 mask / bbox 均为输出图像坐标，按 score 取前 max_masks 个，mask_id 重新编号
+    """
+    out_h, out_w = out_shape
+    # 每个 ROI 分割后只保留到目前为止 score 最高的 max_masks 个 ROI 内 mask（小顶堆），
+    # 截断后再展开为整幅 mask，内存与 ROI 数量无关
+    heap = []  # (score, -序号, ROI 内 mask, 目标矩形, 裁剪图 -> 输出图像的缩放)
+    seq = 0
+    for x1, y1, x2, y2 in rois:
+        crop = np.ascontiguousarray(source[y1:y2, x1:x2])
+        if max_size is not None:
+            crop, _ = resize_if_needed(crop, max_size)
+
+        masks = model_pool.segment_auto(
+            crop,
+            min_area_ratio=min_area_ratio,
+            max_masks=max_masks,
+            text_prompt=text_prompt,
+        )
+
+        # ROI 在输出图像中的位置（至少 1 像素）
+        tx1 = min(int(x1 * scale), out_w - 1)
+        ty1 = min(int(y1 * scale), out_h - 1)
+        target = (
+            tx1, ty1,
+            min(out_w, max(tx1 + 1, round(x2 * scale))),
+            min(out_h, max(ty1 + 1, round(y2 * scale))),
+        )
+        # 裁剪图坐标 -> 输出图像坐标
+        fx = (target[2] - target[0]) / crop.shape[1]
+        fy = (target[3] - target[1]) / crop.shape[0]
+        for m in masks:
+            # score 相同时先出现的优先（-序号 越小越先被淘汰）
+            heapq.heappush(heap, (m.score, -seq, m, target, fx, fy))
+            seq += 1
+            if len(heap) > max_masks:
+                heapq.heappop(heap)
+        del masks
+
+    results: List[MaskResult] = []
+    for i, (_, _, m, target, fx, fy) in enumerate(sorted(heap, key=lambda c: c[:2], reverse=True)):
+        tx1, ty1, tx2, ty2 = target
+        local = _resize_mask(m.mask, target)
+        bx1, by1, bx2, by2 = m.bbox
+        results.append(MaskResult(
+            mask_id=i,
+            mask=_map_mask(local, target, out_shape) if expand_masks else m.mask,
+            bbox=(
+                tx1 + int(bx1 * fx), ty1 + int(by1 * fy),
+                tx1 + int(round(bx2 * fx)), ty1 + int(round(by2 * fy)),
+            ),
+            area=int(local.sum()),
+            score=m.score,
+        ))
+    return results
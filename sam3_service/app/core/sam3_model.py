@@ -1,14 +1,16 @@
 """
-SAM3 模型封装（单例）
-支持 mock 和 real 两种模式，通过环境变量 SAM3_MODE 控制
+SAM3 模型封装（单个设备上的一个副本）
+支持 mock 和 real 两种模式，通过环境变量 SAM3_MODE 控制；
+多副本的创建与路由见 model_pool.py
 """
+from collections import OrderedDict
 from dataclasses import dataclass
 from typing import List, Optional
 
 import numpy as np
 from PIL import Image
 
-from .config import DEVICE, SAM3_HF_REPO, SAM3_MODE
+from .config import DEVICE, EMBEDDING_CACHE_SIZE, SAM3_HF_REPO, SAM3_MODE
 
 
 @dataclass
@@ -22,26 +24,18 @@ class MaskResult:
 
 
 class SAM3Model:
-    """SAM3 模型单例封装"""
+    """SAM3 模型封装（非线程安全，同一时刻只应处理一个请求，由 ModelPool 保证）"""
     
-    _instance: Optional["SAM3Model"] = None
-    
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super().__new__(cls)
-            cls._instance._initialized = False
-        return cls._instance
-    
-    def __init__(self):
-        if self._initialized:
-            return
-        self._initialized = True
+    def __init__(self, device: str = DEVICE):
         self.model = None
         self.processor = None
-        self.device = DEVICE
+        self.device = device
         self.hf_repo = SAM3_HF_REPO
         self.mode = SAM3_MODE
         self._loaded = False
+        # 图像编码缓存：image_key -> set_image 返回的 inference_state，
+        # 同一张图片换提示词时无需重新跑图像编码器
+        self._state_cache: "OrderedDict[str, dict]" = OrderedDict()
     
     def load(self) -> bool:
         """加载模型"""
@@ -62,9 +56,9 @@ class SAM3Model:
             from sam3.model_builder import build_sam3_image_model
             from sam3.model.sam3_image_processor import Sam3Processor
             
-            print(f"[SAM3Model] Loading real model from {self.hf_repo}...")
-            self.model = build_sam3_image_model()
-            self.processor = Sam3Processor(self.model)
+            print(f"[SAM3Model] Loading real model from {self.hf_repo} on {self.device}...")
+            self.model = build_sam3_image_model(device=self.device)
+            self.processor = Sam3Processor(self.model, device=self.device)
             print(f"[SAM3Model] Model loaded successfully, device={self.device}")
             self._loaded = True
             return True
@@ -72,6 +66,16 @@ class SAM3Model:
             print(f"[SAM3Model] Failed to load model: {e}")
             raise
     
+    def unload(self) -> None:
+        """释放模型及图像编码缓存"""
+        self._state_cache.clear()
+        self.model = None
+        self.processor = None
+        self._loaded = False
+        if self.mode == "real" and self.device.startswith("cuda"):
+            import torch
+            torch.cuda.empty_cache()
+    
     @property
     def is_loaded(self) -> bool:
         return self._loaded
@@ -82,17 +86,19 @@ class SAM3Model:
         min_area_ratio: float = 0.01,
         max_masks: int = 50,
         text_prompt: str = "all objects",
+        image_key: Optional[str] = None,
     ) -> List[MaskResult]:
         """
         自动分割。
         
         在 real 模式下使用 SAM3 的文本 prompt 能力，默认 prompt 为 "all objects"。
+        image_key 为图像内容指纹，提供时复用该图像已缓存的图像编码。
         """
         if not self._loaded:
             raise RuntimeError("Model not loaded. Call load() first.")
         
         if self.mode == "real":
-            return self._segment_real(image, text_prompt, min_area_ratio, max_masks)
+            return self._segment_real(image, text_prompt, min_area_ratio, max_masks, image_key)
         else:
             return self._segment_mock(image, min_area_ratio, max_masks)
     
@@ -128,17 +134,15 @@ class SAM3Model:
         text_prompt: str,
         min_area_ratio: float,
         max_masks: int,
+        image_key: Optional[str] = None,
     ) -> List[MaskResult]:
         """真实 SAM3 分割"""
         h, w = image.shape[:2]
         total_area = h * w
         min_area = int(total_area * min_area_ratio)
         
-        # 转换为 PIL Image
-        pil_image = Image.fromarray(image)
-        
-        # 设置图像并执行分割
-        inference_state = self.processor.set_image(pil_image)
+        # 设置图像并执行分割（命中缓存时跳过图像编码）
+        inference_state = self._get_inference_state(image, image_key)
         output = self.processor.set_text_prompt(state=inference_state, prompt=text_prompt)
         
         masks = output["masks"]  # List of mask arrays
@@ -180,6 +184,19 @@ class SAM3Model:
         results.sort(key=lambda x: x.score, reverse=True)
         return results[:max_masks]
     
+    def _get_inference_state(self, image: np.ndarray, image_key: Optional[str]) -> dict:
+        """获取图像的 inference_state，按 image_key 做 LRU 缓存"""
+        if image_key is not None and image_key in self._state_cache:
+            self._state_cache.move_to_end(image_key)
+            return self._state_cache[image_key]
+        
+        inference_state = self.processor.set_image(Image.fromarray(image))
+        if image_key is not None and EMBEDDING_CACHE_SIZE > 0:
+            self._state_cache[image_key] = inference_state
+            while len(self._state_cache) > EMBEDDING_CACHE_SIZE:
+                self._state_cache.popitem(last=False)
+        return inference_state
+    
     def segment_with_prompts(
         self,
         image: np.ndarray,
@@ -197,6 +214,3 @@ class SAM3Model:
         # 目前返回空列表，后续可扩展
         return []
 
-
-# 全局单例
-sam3_model = SAM3Model()
@@ -3,11 +3,14 @@ SAM3 服务入口
 """
 from contextlib import asynccontextmanager
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 
 from .core.config import STATIC_DIR
-from .core.sam3_model import sam3_model
+from .core.memory_budget import MemoryBudgetExceeded
+from .core.model_pool import model_pool
+from .api.admin import router as admin_router
 from .api.health import router as health_router
 from .api.v1.segmentation import router as segmentation_router
 from .api.v1.privacy import router as privacy_router
@@ -17,8 +20,8 @@ from .api.v1.privacy import router as privacy_router
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
     # 启动时加载模型
-    print("[Startup] Loading SAM3 model...")
-    sam3_model.load()
+    print(f"[Startup] Loading SAM3 model replicas on {[r.device for r in model_pool.replicas]}...")
+    model_pool.load()
     print("[Startup] Model loaded.")
     yield
     # 关闭时清理（如有需要）
@@ -36,6 +39,16 @@ app = FastAPI(
 app.include_router(health_router)
 app.include_router(segmentation_router, prefix="/v1")
 app.include_router(privacy_router, prefix="/v1")
+app.include_router(admin_router)
+
+
+@app.exception_handler(MemoryBudgetExceeded)
+async def memory_budget_exceeded_handler(request: Request, exc: MemoryBudgetExceeded):
+    """内存准入失败：进程繁忙返回 503（可重试），请求过大返回 413"""
+    if exc.retryable:
+        return JSONResponse(status_code=503, content={"detail": str(exc)}, headers={"Retry-After": "1"})
+    return JSONResponse(status_code=413, content={"detail": str(exc)})
+
 
 # 静态文件服务（前端页面）
 if STATIC_DIR.exists():
@@ -23,6 +23,132 @@ const regionsInfo = document.getElementById('regions-info');
 
 let selectedFile = null;
 let lastPreviewRegions = 0;
+let lastResultId = null;  // 最近一次 /v1/privacy/filter 的分割结果 id，用于参数调整时重新渲染
+let preparedUpload = null;  // 当前图片缩放压缩后的上传内容（Promise<Blob>），同一张图片只处理一次
+// 各类请求进行中的 AbortController，只取消输入已变更的那一类请求
+const inflight = { preview: null, filter: null, render: null };
+let blurChangedDuringFilter = false;  // 模糊请求进行中时模糊参数是否又有变化
+
+// 上传参数，启动时从 /health 获取；获取失败时使用默认值
+const uploadConfig = {
+    max_image_size: 2048,
+    accepted_formats: ['image/jpeg', 'image/png'],
+    upload_quality: 0.92,
+};
+
+async function loadUploadConfig() {
+    try {
+        const response = await fetch(`${API_BASE}/health`);
+        if (!response.ok) return;
+        const data = await response.json();
+        for (const key of Object.keys(uploadConfig)) {
+            if (data[key] !== undefined) uploadConfig[key] = data[key];
+        }
+    } catch (err) {
+        console.warn('无法获取上传参数，使用默认值', err);
+    }
+}
+
+// 选图可能早于 /health 返回，缩放压缩前需等待上传参数就绪
+const uploadConfigReady = loadUploadConfig();
+
+/**
+ * 在客户端将图片缩放到服务端工作分辨率并压缩，减少上传体积。
+ * 服务端本来也会缩放到 max_image_size，多余像素上传后只会被丢弃。
+ * 浏览器不支持相关 API 时回退为上传原文件。
+ */
+async function prepareUploadBlob(file) {
+    if (typeof createImageBitmap !== 'function') return file;
+    await uploadConfigReady;
+    
+    let bitmap;
+    try {
+        bitmap = await createImageBitmap(file);
+    } catch (err) {
+        console.warn('图片解码失败，直接上传原文件', err);
+        return file;
+    }
+    
+    // 与服务端 resize_if_needed 保持一致：长边不超过 max_image_size，尺寸向下取整
+    const maxDim = Math.max(bitmap.width, bitmap.height);
+    const scale = Math.min(1, uploadConfig.max_image_size / maxDim);
+    const width = Math.max(1, Math.floor(bitmap.width * scale));
+    const height = Math.max(1, Math.floor(bitmap.height * scale));
+    
+    let canvas;
+    if (typeof OffscreenCanvas !== 'undefined') {
+        canvas = new OffscreenCanvas(width, height);
+    } else {
+        canvas = document.createElement('canvas');
+        canvas.width = width;
+        canvas.height = height;
+    }
+    const ctx = canvas.getContext('2d');
+    ctx.imageSmoothingQuality = 'high';
+    ctx.drawImage(bitmap, 0, 0, width, height);
+    bitmap.close();
+    
+    // 按服务端给出的优先级尝试编码；浏览器不支持某格式时会退回 PNG，需检查实际类型
+    for (const format of uploadConfig.accepted_formats) {
+        const blob = await encodeCanvas(canvas, format, uploadConfig.upload_quality);
+        if (!blob || blob.type !== format) continue;
+        // 未缩放且压缩后反而更大时，直接上传原文件
+        if (scale === 1 && blob.size >= file.size) return file;
+        return blob;
+    }
+    return file;
+}
+
+function encodeCanvas(canvas, type, quality) {
+    if (canvas.convertToBlob) {
+        return canvas.convertToBlob({ type, quality }).catch(() => null);
+    }
+    return new Promise((resolve) => canvas.toBlob(resolve, type, quality));
+}
+
+async function getUploadBlob() {
+    if (!preparedUpload) {
+        preparedUpload = prepareUploadBlob(selectedFile);
+    }
+    return preparedUpload;
+}
+
+function appendImage(formData, blob) {
+    // Blob 没有文件名，按实际格式补一个，便于服务端识别
+    const name = blob.name || `upload.${blob.type.split('/')[1] || 'bin'}`;
+    formData.append('image', blob, name);
+}
+
+// 发起新请求前取消同类进行中的请求，避免旧参数的结果覆盖新结果
+function startRequest(kind) {
+    if (inflight[kind]) inflight[kind].abort();
+    const controller = new AbortController();
+    inflight[kind] = controller;
+    return controller.signal;
+}
+
+// 请求结束时清除登记（已被同类新请求取代时保留新的）
+function finishRequest(kind, signal) {
+    if (inflight[kind] && inflight[kind].signal === signal) inflight[kind] = null;
+}
+
+// 取消指定类别的进行中请求（默认全部）；确有请求被取消时清除"处理中"状态
+function cancelInflight(...kinds) {
+    if (kinds.length === 0) kinds = Object.keys(inflight);
+    let cancelled = false;
+    for (const kind of kinds) {
+        if (inflight[kind]) {
+            inflight[kind].abort();
+            inflight[kind] = null;
+            cancelled = true;
+        }
+    }
+    if (cancelled) clearStatus();
+}
+
+function isAbortError(err) {
+    return err && err.name === 'AbortError';
+}
 
 // 更新强度显示
 blurStrength.addEventListener('input', () => {
@@ -33,7 +159,9 @@ blurStrength.addEventListener('input', () => {
 imageInput.addEventListener('change', (e) => {
     const file = e.target.files[0];
     if (!file) {
+        cancelInflight();
         selectedFile = null;
+        preparedUpload = null;
         previewBtn.disabled = true;
         applyBtn.disabled = true;
         originalPreview.style.display = 'none';
@@ -41,7 +169,9 @@ imageInput.addEventListener('change', (e) => {
         return;
     }
     
+    cancelInflight();
     selectedFile = file;
+    preparedUpload = prepareUploadBlob(file);  // 提前在后台缩放压缩
     previewBtn.disabled = false;
     applyBtn.disabled = false;  // 允许直接应用模糊（mock 模式）
     
@@ -59,8 +189,33 @@ imageInput.addEventListener('change', (e) => {
     resultPlaceholder.style.display = 'flex';
     regionsInfo.textContent = '';
     lastPreviewRegions = 0;
+    lastResultId = null;
 });
 
+// 提示词变化后需要重新推理，旧的分割结果不再适用，进行中的请求也一并取消
+if (textPromptInput.addEventListener) {
+    textPromptInput.addEventListener('input', () => {
+        cancelInflight();
+        lastResultId = null;
+    });
+}
+if (previewMode) {
+    previewMode.addEventListener('change', () => cancelInflight('preview'));
+}
+
+// 模糊参数变化：已有分割结果时直接重新渲染，无需重新上传和推理（分割预览不受影响）。
+// 模糊请求进行中时不取消它（其分割结果仍然有效），完成后再按新参数重新渲染
+function onBlurParamsChange() {
+    if (inflight.filter) {
+        blurChangedDuringFilter = true;
+        cancelInflight('render');
+    } else if (lastResultId) {
+        renderStoredResult();
+    }
+}
+blurStrength.addEventListener('change', onBlurParamsChange);
+blurType.addEventListener('change', onBlurParamsChange);
+
 // 预览分割
 previewBtn.addEventListener('click', async () => {
     if (!selectedFile) return;
@@ -70,15 +225,17 @@ previewBtn.addEventListener('click', async () => {
     previewBtn.disabled = true;
     applyBtn.disabled = true;
     
+    const signal = startRequest('preview');
     try {
         const formData = new FormData();
-        formData.append('image', selectedFile);
+        appendImage(formData, await getUploadBlob());
         formData.append('text_prompt', textPromptInput.value || 'all objects');
         formData.append('preview_mode', previewMode ? previewMode.value : 'heatmap');
         
         const response = await fetch(`${API_BASE}/v1/segment/text_preview`, {
             method: 'POST',
             body: formData,
+            signal,
         });
         
         if (!response.ok) {
@@ -103,6 +260,7 @@ previewBtn.addEventListener('click', async () => {
         // 有区域时才允许应用模糊
         applyBtn.disabled = regionCount === 0;
     } catch (err) {
+        if (isAbortError(err)) return;  // 已被取消或被同类新请求取代，状态由对方更新
         console.error(err);
         // 网络错误时提示用户可以直接用"应用模糊"
         if (err.message.includes('fetch') || err.message.includes('Failed')) {
@@ -111,6 +269,7 @@ previewBtn.addEventListener('click', async () => {
             setStatus('error', `错误: ${err.message}`);
         }
     } finally {
+        finishRequest('preview', signal);
         previewBtn.disabled = !selectedFile;
         applyBtn.disabled = !selectedFile;  // 保持可用
     }
@@ -124,9 +283,11 @@ applyBtn.addEventListener('click', async () => {
     previewBtn.disabled = true;
     applyBtn.disabled = true;
     
+    const signal = startRequest('filter');
+    blurChangedDuringFilter = false;
     try {
         const formData = new FormData();
-        formData.append('image', selectedFile);
+        appendImage(formData, await getUploadBlob());
         formData.append('mode', 'auto');
         formData.append('blur_type', blurType.value);
         formData.append('blur_strength', blurStrength.value);
@@ -135,6 +296,7 @@ applyBtn.addEventListener('click', async () => {
         const response = await fetch(`${API_BASE}/v1/privacy/filter`, {
             method: 'POST',
             body: formData,
+            signal,
         });
         
         if (!response.ok) {
@@ -143,28 +305,83 @@ applyBtn.addEventListener('click', async () => {
         }
         
         const data = await response.json();
-        
-        // 显示最终模糊结果
-        resultPreview.src = data.filtered_image_base64;
-        resultPreview.style.display = 'block';
-        resultPlaceholder.style.display = 'none';
-        
-        // 显示区域信息
-        const regionCount = data.applied_regions.length;
-        regionsInfo.textContent = `已对 ${regionCount} 个区域应用模糊`;
+        lastResultId = data.result_id || null;
+        showFilterResult(data);
         
         setStatus('success', '处理完成！');
+        if (blurChangedDuringFilter && lastResultId) renderStoredResult();
     } catch (err) {
+        if (isAbortError(err)) return;  // 已被取消或被同类新请求取代，状态由对方更新
         console.error(err);
         setStatus('error', `错误: ${err.message}`);
     } finally {
+        finishRequest('filter', signal);
         previewBtn.disabled = !selectedFile;
         applyBtn.disabled = !selectedFile;  // 保持可用
     }
 });
 
+// 基于已存储的分割结果重新渲染
+async function renderStoredResult() {
+    const resultId = lastResultId;
+    setStatus('loading', '正在重新渲染...');
+    
+    const signal = startRequest('render');
+    try {
+        const formData = new FormData();
+        formData.append('result_id', resultId);
+        formData.append('blur_type', blurType.value);
+        formData.append('blur_strength', blurStrength.value);
+        
+        const response = await fetch(`${API_BASE}/v1/privacy/render`, {
+            method: 'POST',
+            body: formData,
+            signal,
+        });
+        
+        if (response.status === 404) {
+            // 结果已过期，需要重新点击"应用模糊"
+            lastResultId = null;
+            setStatus('error', '分割结果已过期，请重新点击"应用模糊"');
+            return;
+        }
+        if (!response.ok) {
+            const errText = await response.text();
+            throw new Error(`渲染失败: ${response.status} - ${errText}`);
+        }
+        
+        const data = await response.json();
+        // 期间若已切换图片或提示词，丢弃过期的渲染结果
+        if (resultId !== lastResultId) return;
+        showFilterResult(data);
+        
+        setStatus('success', '重新渲染完成！');
+    } catch (err) {
+        if (isAbortError(err)) return;  // 被更新的参数取代
+        console.error(err);
+        setStatus('error', `错误: ${err.message}`);
+    } finally {
+        finishRequest('render', signal);
+    }
+}
+
+function showFilterResult(data) {
+    // 显示最终模糊结果
+    resultPreview.src = data.filtered_image_base64;
+    resultPreview.style.display = 'block';
+    resultPlaceholder.style.display = 'none';
+    
+    // 显示区域信息
+    const regionCount = data.applied_regions.length;
+    regionsInfo.textContent = `已对 ${regionCount} 个区域应用模糊`;
+}
+
 function setStatus(type, message) {
     statusDiv.style.display = 'block';
     statusDiv.className = `status ${type}`;
     statusDiv.textContent = message;
 }
+
+function clearStatus() {
+    statusDiv.style.display = 'none';
+}
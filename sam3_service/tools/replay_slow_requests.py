@@ -0,0 +1,106 @@
+"""
+慢请求离线回放
+
+将 /admin/slow_requests?include_input=true 导出的 JSON 重新送入与线上相同的接口处理流程，
+输出每次回放的分阶段耗时，便于与线上记录对比、复现 p99 抖动。
+
+用法（在项目根目录执行）：
+    curl -H "X-Admin-Token: $SAM3_ADMIN_TOKEN" \\
+        "http://127.0.0.1:8000/admin/slow_requests?include_input=true" > slow.json
+    python -m sam3_service.tools.replay_slow_requests slow.json --repeat 3
+"""
+import argparse
+import asyncio
+import base64
+import json
+from io import BytesIO
+
+from fastapi import HTTPException, UploadFile
+
+from ..app.api.v1.privacy import privacy_filter, privacy_render
+from ..app.api.v1.segmentation import segment_auto, text_preview
+from ..app.core.model_pool import model_pool
+from ..app.core.profiling import slow_request_recorder
+
+
+# endpoint 名 -> (接口函数, 是否需要上传图像)
+ENDPOINTS = {
+    "privacy/filter": (privacy_filter, True),
+    "privacy/render": (privacy_render, False),
+    "segment/auto": (segment_auto, True),
+    "segment/text_preview": (text_preview, True),
+}
+
+
+async def replay_one(record: dict) -> dict:
+    """回放单条记录，返回本次回放的 trace 记录"""
+    func, needs_image = ENDPOINTS[record["endpoint"]]
+    kwargs = dict(record["params"])
+    if needs_image:
+        data = base64.b64decode(record["input_base64"])
+        kwargs["image"] = UploadFile(file=BytesIO(data), filename="replay")
+
+    slow_request_recorder.clear()
+    error = None
+    try:
+        await func(**kwargs)
+    except HTTPException as e:
+        print(f"  -> HTTP {e.status_code}: {e.detail}")
+    except Exception as e:
+        # 单条失败不影响其余记录，trace 中已记录错误与出错前各阶段耗时
+        error = f"{type(e).__name__}: {e}"
+        print(f"  -> {error}")
+
+    records = slow_request_recorder.records()
+    if records:
+        return records[-1]
+    # 在进入 trace 之前就失败（如输入无法解析），没有 trace 记录
+    return {"endpoint": record["endpoint"], "total_ms": 0.0, "stages": {}, "error": error}
+
+
+def format_stages(stages: dict) -> str:
+    return ", ".join(f"{k}={v:.1f}ms" for k, v in stages.items())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay captured slow requests offline")
+    parser.add_argument("dump", help="/admin/slow_requests?include_input=true 导出的 JSON 文件")
+    parser.add_argument("--repeat", type=int, default=1, help="每条记录回放次数")
+    parser.add_argument("--endpoint", default=None, help="只回放指定 endpoint，如 privacy/filter")
+    parser.add_argument("--output", default=None, help="将回放结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    with open(args.dump, encoding="utf-8") as f:
+        records = json.load(f)
+
+    model_pool.load()
+    # 回放时记录每一次请求，借用线上的 trace 采集
+    slow_request_recorder.threshold_ms = 0
+
+    results = []
+    for i, record in enumerate(records):
+        endpoint = record["endpoint"]
+        if args.endpoint and endpoint != args.endpoint:
+            continue
+        if endpoint not in ENDPOINTS:
+            print(f"[{i}] {endpoint}: unsupported endpoint, skipped")
+            continue
+        if ENDPOINTS[endpoint][1] and not record.get("input_base64"):
+            print(f"[{i}] {endpoint}: input not captured (sha256={record.get('input_sha256')}), skipped")
+            continue
+
+        print(f"[{i}] {endpoint} image_size={record.get('image_size')} mask_count={record.get('mask_count')}")
+        print(f"  original: total={record['total_ms']:.1f}ms {format_stages(record['stages'])}")
+        for n in range(args.repeat):
+            replayed = asyncio.run(replay_one(record))
+            print(f"  replay {n}: total={replayed['total_ms']:.1f}ms {format_stages(replayed['stages'])}")
+            results.append({"index": i, "original": {k: v for k, v in record.items() if k != "input_base64"},
+                            "replay": replayed})
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()